@@ -5,7 +5,7 @@ import os
 # Initialize SQLAlchemy
 db = SQLAlchemy()
 
-def create_app():
+def create_app(db_path=None):
     # Get the parent directory (project root) to properly locate templates and static folders
     parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     template_folder = os.path.join(parent_dir, 'templates')
@@ -19,9 +19,16 @@ def create_app():
     app.config['SECRET_KEY'] = 'your-secret-key-here-change-in-production'
     app.config['UPLOAD_FOLDER'] = 'data/uploads'
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['PARSE_CACHE_MAX_BYTES'] = 256 * 1024 * 1024  # On-disk parse cache budget
+    app.config['PARSER_PROFILE'] = False  # Time every parser pattern, see /api/parser-stats
+    app.config['BODY_CACHE_ENTRIES'] = 100000  # Parsed message bodies memoised in memory
+    app.config['BODY_CACHE_PERSIST'] = False  # Also keep memoised bodies in data/body_cache.db
+    app.config['INGEST_COMMIT_EVERY'] = 50000  # Commit and checkpoint web ingests every N transactions (0 = all at once)
+    app.config['SQLITE_PROFILE'] = 'balanced'  # PRAGMA preset for momo.db: 'safe', 'balanced' or 'bulk-ingest'
+    app.config['RESPONSE_CACHE_ENTRIES'] = 512  # Read-only API responses kept until the data changes (0 = off)
     
-    # Database configuration - use absolute path
-    db_path = os.path.join(parent_dir, 'data', 'momo.db')
+    # Database configuration - use absolute path; db_path points the app at another file, as the tests do
+    db_path = db_path or os.path.join(parent_dir, 'data', 'momo.db')
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
@@ -54,12 +61,20 @@ def create_app():
     db.init_app(app)
     
     # Import models after db initialization
-    from .models import Transaction, UploadHistory
+    from .models import Transaction, UploadHistory, SourceWatermark, CategoryRollup, MonthlyRollup, DailyRollup
     
     # Create database tables
     with app.app_context():
         try:
+            # Tune every connection before the first one is opened
+            from .sqlite_profiles import install_sqlite_profile
+            install_sqlite_profile(db.engine, app.config['SQLITE_PROFILE'])
+            
             db.create_all()
+            
+            # Add columns and indexes introduced since the database was created
+            from .database import DatabaseService
+            DatabaseService.upgrade_schema()
             print(f"✅ Database created successfully: {db_path}")
             
             # Verify database file exists
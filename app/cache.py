@@ -0,0 +1,321 @@
+"""
+Caches for MoMo Analytics
+ParseCache stores parsed transaction lists on disk keyed by a hash of the XML
+backup; BodyCache memoises the fields extracted from individual SMS bodies;
+ResponseCache keeps read-only API responses until the stored data changes
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+# Default location and size budget for cached parse results
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'parse_cache')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Bump when the parser output changes so stale cache entries are ignored
+CACHE_FORMAT_VERSION = 3
+
+CACHE_SUFFIX = '.cache'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Default size and persistent location of the body memo
+DEFAULT_BODY_CACHE_ENTRIES = 100000
+DEFAULT_BODY_CACHE_PATH = os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), 'body_cache.db')
+# Persistent entries are written in batches of this many
+BODY_CACHE_WRITE_BATCH = 1000
+
+# Default number of API responses kept by ResponseCache
+DEFAULT_RESPONSE_CACHE_ENTRIES = 512
+
+
+class ParseCache:
+    """Size-bounded LRU cache of parse results stored under ``data/``"""
+    
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    @staticmethod
+    def hash_file(file_path):
+        """Return the SHA-256 hex digest of a file's contents"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _entry_path(self, content_hash):
+        return os.path.join(self.cache_dir, content_hash + CACHE_SUFFIX)
+    
+    def get(self, content_hash, parser_key=None):
+        """Return cached ``(transactions, sms_count, max_sms_date)`` for a content hash, or None"""
+        path = self._entry_path(content_hash)
+        try:
+            with open(path, 'rb') as f:
+                payload = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError) as e:
+            print(f"Warning: Discarding unreadable parse cache entry {path}: {e}")
+            self._remove(path)
+            return None
+        
+        if payload.get('version') != CACHE_FORMAT_VERSION or payload.get('parser_key') != parser_key:
+            return None
+        
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        
+        return payload['transactions'], payload['sms_count'], payload['max_sms_date']
+    
+    def put(self, content_hash, transactions, sms_count, parser_key=None, max_sms_date=0):
+        """Store a parse result and evict least recently used entries over budget"""
+        payload = {
+            'version': CACHE_FORMAT_VERSION,
+            'parser_key': parser_key,
+            'sms_count': sms_count,
+            'max_sms_date': max_sms_date,
+            'transactions': transactions
+        }
+        data = zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        if len(data) > self.max_bytes:
+            return False
+        
+        # Write atomically so concurrent readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._entry_path(content_hash))
+        except OSError as e:
+            print(f"Warning: Could not write parse cache entry: {e}")
+            self._remove(temp_path)
+            return False
+        
+        self._evict(keep=content_hash)
+        return True
+    
+    def _evict(self, keep=None):
+        """Remove least recently used entries until the cache fits in ``max_bytes``"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        
+        keep_path = self._entry_path(keep) if keep else None
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            self._remove(path)
+            total -= size
+    
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class BodyCache:
+    """Memo of parsed fields keyed by a hash of the SMS body
+
+    Entries live in an in-memory LRU of ``max_entries``. With ``db_path`` an
+    SQLite file is used as a second, persistent tier so results survive
+    restarts. ``version`` identifies the parser patterns; persistent entries
+    written under another version are discarded when the file is opened.
+    """
+    
+    def __init__(self, max_entries=DEFAULT_BODY_CACHE_ENTRIES, db_path=None, version=None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._connection = None
+        if db_path:
+            self._open(db_path, version)
+    
+    def _open(self, db_path, version):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS body_cache (hash BLOB PRIMARY KEY, fields TEXT NOT NULL)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS body_cache_meta (key TEXT PRIMARY KEY, value TEXT)')
+            row = self._connection.execute("SELECT value FROM body_cache_meta WHERE key = 'version'").fetchone()
+            stored_version = row[0] if row else None
+            if stored_version != str(version):
+                if stored_version is not None:
+                    print(f"Body cache patterns changed ({stored_version} -> {version}), clearing {db_path}")
+                self._connection.execute('DELETE FROM body_cache')
+                self._connection.execute("INSERT OR REPLACE INTO body_cache_meta (key, value) VALUES ('version', ?)",
+                                         (str(version),))
+    
+    @staticmethod
+    def key(body):
+        """Return the cache key for a message body"""
+        return hashlib.blake2b(body.encode('utf-8'), digest_size=16).digest()
+    
+    def get(self, key):
+        """Return the cached field values for a key, or None"""
+        with self._lock:
+            values = self.entries.get(key)
+            if values is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return values
+            
+            if self._connection is not None:
+                row = self._connection.execute('SELECT fields FROM body_cache WHERE hash = ?', (key,)).fetchone()
+                if row is not None:
+                    values = tuple(json.loads(row[0]))
+                    self._remember(key, values)
+                    self.persistent_hits += 1
+                    return values
+            
+            self.misses += 1
+            return None
+    
+    def put(self, key, values):
+        """Store the field values parsed for a key"""
+        with self._lock:
+            self._remember(key, values)
+            if self._connection is not None:
+                self._pending.append((key, json.dumps(values)))
+                if len(self._pending) >= BODY_CACHE_WRITE_BATCH:
+                    self._flush()
+    
+    def _remember(self, key, values):
+        self.entries[key] = values
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+    
+    def flush(self):
+        """Write pending entries to the persistent tier"""
+        with self._lock:
+            self._flush()
+    
+    def _flush(self):
+        if not self._pending or self._connection is None:
+            return
+        try:
+            with self._connection:
+                self._connection.executemany('INSERT OR REPLACE INTO body_cache (hash, fields) VALUES (?, ?)',
+                                             self._pending)
+        except sqlite3.Error as e:
+            print(f"Warning: Could not write body cache entries: {e}")
+        self._pending = []
+    
+    def stats(self):
+        """Return hit/miss counters for sizing the cache"""
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'persistent': self._connection is not None,
+            'hits': self.hits,
+            'persistent_hits': self.persistent_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+class ResponseCache:
+    """In-memory LRU of API responses for one data generation
+
+    Entries are stored with the data generation (see
+    DatabaseService.data_generation) they were computed for. The first
+    lookup or store under a newer generation drops everything, and results
+    computed for an older one are not stored, so a response is never served
+    after the data it was built from has changed.
+    """
+    
+    def __init__(self, max_entries=DEFAULT_RESPONSE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key, generation):
+        """Return the response cached for a key under ``generation``, or None"""
+        with self._lock:
+            if self._advance(generation):
+                value = self.entries.get(key)
+                if value is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+            
+            self.misses += 1
+            return None
+    
+    def put(self, key, generation, value):
+        """Store a response computed from the data of ``generation``"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if not self._advance(generation):
+                return
+            
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def _advance(self, generation):
+        """Move to ``generation`` if it is newer, returning False if it is older than the entries"""
+        if self.generation is not None and generation < self.generation:
+            return False
+        if generation != self.generation:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.generation = generation
+        return True
+    
+    def stats(self):
+        """Return hit/miss counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'generation': self.generation,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -4,52 +4,255 @@ Handles all database operations using SQLAlchemy
 """
 
 from datetime import datetime
-from sqlalchemy import func, extract, desc
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import func, desc, text, select, table, column
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError, OperationalError
 from . import db
-from .models import Transaction, UploadHistory
+from .models import Transaction, UploadHistory, SourceWatermark, CategoryRollup, MonthlyRollup, DailyRollup
+from .records import TransactionRecord
+from .parser import BACKUP_FILE_PATTERNS
 import os
 import glob
+import hashlib
+import base64
+import json
+import math
+import threading
+
+# Backup source used when an ingest does not name one
+DEFAULT_SOURCE = 'default'
+
+# Rows sent to the database per executemany call by add_multiple_transactions
+BULK_INSERT_BATCH_SIZE = 5000
+
+# Distinct filters whose transaction counts are kept per data generation
+COUNT_CACHE_MAX_FILTERS = 256
+
+# Bumped after every committed change to the transactions table; cached counts are only valid for one generation
+_data_generation = 0
+# When the current generation began, reported as the stats' last_updated so it holds for cached responses too
+_data_updated_at = datetime.now()
+_count_cache = {}
+_cache_lock = threading.Lock()
+
+# Columns added after the first release; upgrade_schema() adds them to older databases
+SCHEMA_COLUMNS = [
+    ('upload_history', 'content_hash', 'VARCHAR(64)'),
+    ('upload_history', 'batch_id', 'VARCHAR(32)'),
+    ('upload_history', 'duplicate_messages', 'INTEGER DEFAULT 0'),
+    ('transactions', 'merge_key', 'VARCHAR(32)')
+]
+
+# Indexes added after the first release, as (name, table, columns)
+SCHEMA_INDEXES = [
+    ('ix_upload_history_content_hash', 'upload_history', 'content_hash'),
+    ('ix_upload_history_batch_id', 'upload_history', 'batch_id'),
+    ('ix_transactions_date', 'transactions', 'date'),
+    ('ix_transactions_category_date', 'transactions', 'category, date')
+]
+
+# Indexes no longer used by any query, dropped so inserts stop maintaining them
+DROPPED_INDEXES = [
+    # Per-category counts and sums now read category_rollups
+    'ix_transactions_category_totals',
+    # Covered the date totals and monthly stats, which now read the rollups; replaced by ix_transactions_date
+    'ix_transactions_date_totals'
+]
+
+# Unique indexes added after the first release, created once their column is filled in
+SCHEMA_UNIQUE_INDEXES = [
+    ('ux_transactions_merge_key', 'transactions', 'merge_key')
+]
+
+# Columns covered by the transaction search box
+SEARCH_COLUMNS = ('recipient_name', 'sender_name', 'message', 'category', 'transaction_id')
+
+# FTS5 trigram index over SEARCH_COLUMNS; it matches substrings like LIKE '%term%' but only for terms of 3+ characters
+SEARCH_INDEX_MIN_LENGTH = 3
+# Terms matching at least this share of rows are paged by scanning the date index, rarer ones from the search index
+SEARCH_SCAN_MIN_SHARE = 0.001
+SEARCH_INDEX_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+        {', '.join(SEARCH_COLUMNS)}, content='transactions', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF {', '.join(SEARCH_COLUMNS)} ON transactions BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + name for name in SEARCH_COLUMNS)});
+        INSERT INTO transactions_fts (rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + name for name in SEARCH_COLUMNS)});
+    END"""
+]
+# New rows are indexed per insert batch by add_multiple_transactions and all rows are dropped by
+# clear_transactions, both far faster than per-row insert/delete triggers
+SEARCH_INDEX_SYNC = f"""INSERT INTO transactions_fts (rowid, {', '.join(SEARCH_COLUMNS)})
+    SELECT id, {', '.join(SEARCH_COLUMNS)} FROM transactions WHERE id > :after_id"""
+search_index = table('transactions_fts', column('rowid'), column('rank'))
+
+# Dashboard rollups as (table, key columns, key expressions over transactions)
+ROLLUP_TABLES = [
+    ('category_rollups', ('category',), ('category',)),
+    ('monthly_rollups', ('year', 'month', 'category'),
+     ("CAST(strftime('%Y', date) AS INTEGER)", "CAST(strftime('%m', date) AS INTEGER)", 'category')),
+    ('daily_rollups', ('day',), ('date(date)',))
+]
+# Add the totals of rows past :after_id to each rollup; like the search index they are synced per insert batch
+ROLLUP_SYNC = [
+    f"""INSERT INTO {name} ({', '.join(keys)}, count, amount, fees)
+    SELECT {', '.join(expressions)}, count(*), sum(amount), coalesce(sum(fee), 0) FROM transactions
+    WHERE id > :after_id GROUP BY {', '.join(expressions)}
+    ON CONFLICT ({', '.join(keys)}) DO UPDATE SET
+        count = count + excluded.count, amount = amount + excluded.amount, fees = fees + excluded.fees"""
+    for name, keys, expressions in ROLLUP_TABLES
+]
+
+def merge_key(transaction_id, date, amount, body):
+    """Uniqueness key of a transaction: its transaction id, or else its date, amount and body"""
+    if transaction_id:
+        key = f'id:{transaction_id}'
+    else:
+        key = f'fp:{date.isoformat()}|{float(amount)!r}|{body}'
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
 
 class DatabaseService:
     """Service class for database operations"""
     
     @staticmethod
-    def add_multiple_transactions(transactions_list):
-        """Add multiple transactions to the database"""
+    def upgrade_schema():
+        """Bring an existing database up to date with the current models"""
+        try:
+            inspector = db.inspect(db.engine)
+            with db.engine.begin() as connection:
+                added = set()
+                for table_name, column_name, column_type in SCHEMA_COLUMNS:
+                    existing = {col['name'] for col in inspector.get_columns(table_name)}
+                    if column_name not in existing:
+                        print(f"🔧 Adding column {table_name}.{column_name}")
+                        connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}'))
+                        added.add((table_name, column_name))
+                
+                if ('transactions', 'merge_key') in added:
+                    DatabaseService._backfill_merge_keys(connection)
+                
+                for name, table_name, columns in SCHEMA_INDEXES:
+                    connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table_name} ({columns})'))
+                
+                for name in DROPPED_INDEXES:
+                    connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+                
+                for name, table_name, columns in SCHEMA_UNIQUE_INDEXES:
+                    connection.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table_name} ({columns})'))
+                
+                DatabaseService.sync_rollups(connection)
+            
+            DatabaseService._create_search_index()
+            return True
+        
+        except SQLAlchemyError as e:
+            print(f"Error upgrading database schema: {e}")
+            raise
+    
+    @staticmethod
+    def _create_search_index():
+        """Create the full-text search index and its triggers, indexing existing rows the first time"""
+        try:
+            with db.engine.begin() as connection:
+                created = not DatabaseService.has_search_index(connection)
+                for statement in SEARCH_INDEX_SCHEMA:
+                    connection.execute(text(statement))
+                
+                if created:
+                    print("🔧 Building full-text search index")
+                    connection.execute(text("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')"))
+        
+        except OperationalError as e:
+            # SQLite without FTS5 or the trigram tokenizer (3.34+), search keeps using LIKE
+            print(f"⚠️  Full-text search unavailable: {e}")
+    
+    @staticmethod
+    def has_search_index(connection=None):
+        """Whether the FTS5 search index exists"""
+        statement = text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'")
+        result = (connection or db.session).execute(statement)
+        return result.first() is not None
+    
+    @staticmethod
+    def drop_search_index():
+        """Drop the search index, which is not a model table and so outlives db.drop_all()"""
+        db.session.execute(text('DROP TABLE IF EXISTS transactions_fts'))
+        db.session.commit()
+    
+    @staticmethod
+    def sync_rollups(connection):
+        """Rebuild the dashboard rollups if they do not add up to the stored transactions
+
+        Covers databases created before the rollups existed and rows written
+        without going through add_multiple_transactions.
+        """
+        transactions = connection.execute(select(func.count()).select_from(Transaction)).scalar()
+        rolled_up = connection.execute(select(func.coalesce(func.sum(CategoryRollup.count), 0))).scalar()
+        if transactions == rolled_up:
+            return False
+        
+        print(f"🔧 Rebuilding dashboard rollups for {transactions} transactions")
+        for name, _, _ in ROLLUP_TABLES:
+            connection.execute(text(f'DELETE FROM {name}'))
+        for statement in ROLLUP_SYNC:
+            connection.execute(text(statement), {'after_id': 0})
+        return True
+    
+    @staticmethod
+    def _backfill_merge_keys(connection):
+        """Fill in merge keys of rows stored before they existed, leaving repeats of a key empty"""
+        rows = connection.execute(select(
+            Transaction.id, Transaction.transaction_id, Transaction.date, Transaction.amount, Transaction.raw_body
+        ))
+        
+        seen = set()
+        updates = []
+        for row in rows:
+            key = merge_key(row.transaction_id, row.date, row.amount, row.raw_body)
+            if key not in seen:
+                seen.add(key)
+                updates.append({'row_id': row.id, 'key': key})
+        
+        if updates:
+            connection.execute(text('UPDATE transactions SET merge_key = :key WHERE id = :row_id'), updates)
+        print(f"🔧 Filled in merge keys of {len(updates)} transactions")
+    
+    @staticmethod
+    def add_multiple_transactions(transactions_list, commit=True, batch_size=BULK_INSERT_BATCH_SIZE, merge=False):
+        """Add multiple transactions (TransactionRecords or dicts) to the database
+
+        Rows are inserted with Core ``INSERT`` executemany in batches of
+        ``batch_size``, bypassing ORM object creation and the identity map.
+        Every row is inserted, repeats included; a row whose merge key is
+        already stored (or came earlier) is stored without one. With ``merge``
+        such rows are skipped instead, by ``ON CONFLICT DO NOTHING``.
+        Inserted rows are added to the dashboard rollups and the search index
+        after each batch. With ``commit=False`` the rows are only written to
+        the current transaction, leaving the commit to the caller. Returns
+        the number of rows inserted.
+        """
         try:
             added_count = 0
+            search_indexed = DatabaseService.has_search_index()
+            created_at = datetime.utcnow()
+            rows = []
             
             for transaction_data in transactions_list:
-                # Convert datetime string to datetime object if needed
-                if isinstance(transaction_data.get('date'), str):
-                    try:
-                        transaction_data['date'] = datetime.fromisoformat(transaction_data['date'].replace('Z', '+00:00'))
-                    except ValueError:
-                        transaction_data['date'] = datetime.now()
-                
-                # Create transaction object
-                transaction = Transaction(
-                    transaction_id=transaction_data.get('transaction_id'),
-                    date=transaction_data.get('date', datetime.now()),
-                    amount=float(transaction_data.get('amount', 0)),
-                    fee=float(transaction_data.get('fee', 0)),
-                    balance=float(transaction_data.get('balance')) if transaction_data.get('balance') else None,
-                    category=transaction_data.get('category', 'unknown'),
-                    recipient_name=transaction_data.get('recipient_name'),
-                    recipient_number=transaction_data.get('recipient_number'),
-                    sender_name=transaction_data.get('sender_name'),
-                    sender_number=transaction_data.get('sender_number'),
-                    message=transaction_data.get('message'),
-                    raw_body=transaction_data.get('raw_body', transaction_data.get('body'))
-                )
-                
-                db.session.add(transaction)
-                added_count += 1
+                rows.append(DatabaseService._transaction_row(transaction_data, created_at))
+                if len(rows) >= batch_size:
+                    added_count += DatabaseService._insert_rows(rows, search_indexed, merge)
+                    rows = []
             
-            db.session.commit()
-            return added_count
+            if rows:
+                added_count += DatabaseService._insert_rows(rows, search_indexed, merge)
             
+            if commit:
+                db.session.commit()
+                DatabaseService.bump_data_generation()
+            return added_count
+        
         except SQLAlchemyError as e:
             db.session.rollback()
             print(f"Database error: {e}")
@@ -60,73 +263,340 @@ class DatabaseService:
             raise
     
     @staticmethod
-    def get_all_transactions(page=1, per_page=20, category=None, search=None):
-        """Get paginated transactions with optional filtering"""
-        try:
-            query = Transaction.query
-            
-            # Filter by category
-            if category and category != 'all':
-                query = query.filter(Transaction.category == category)
-            
-            # Search filter
-            if search:
-                search_term = f"%{search}%"
-                query = query.filter(
-                    db.or_(
-                        Transaction.recipient_name.like(search_term),
-                        Transaction.sender_name.like(search_term),
-                        Transaction.message.like(search_term),
-                        Transaction.category.like(search_term),
-                        Transaction.transaction_id.like(search_term)
-                    )
+    def _insert_rows(rows, search_indexed, merge):
+        """Insert one batch of rows and add the new ones to the rollups and search index"""
+        if merge:
+            insert_statement = sqlite_insert(Transaction.__table__).on_conflict_do_nothing(index_elements=['merge_key'])
+        else:
+            DatabaseService._release_repeated_keys(rows)
+            insert_statement = Transaction.__table__.insert()
+        inserted = db.session.execute(insert_statement.returning(Transaction.id), rows).scalars().all()
+        if not inserted:
+            return 0
+        
+        # The INSERT holds the write lock until commit, so the batch's ids follow every stored row; a
+        # maximum read before it could miss rows another writer commits in between
+        after_id = min(inserted) - 1
+        for statement in ROLLUP_SYNC:
+            db.session.execute(text(statement), {'after_id': after_id})
+        if search_indexed:
+            db.session.execute(text(SEARCH_INDEX_SYNC), {'after_id': after_id})
+        return len(inserted)
+    
+    @staticmethod
+    def _release_repeated_keys(rows):
+        """Clear the merge key of rows repeating a stored or earlier key, so the repeats can still be inserted"""
+        keys = [row['merge_key'] for row in rows]
+        seen = set(db.session.execute(select(Transaction.merge_key).where(Transaction.merge_key.in_(keys))).scalars())
+        for row in rows:
+            if row['merge_key'] in seen:
+                row['merge_key'] = None
+            else:
+                seen.add(row['merge_key'])
+    
+    @staticmethod
+    def _transaction_row(transaction_data, created_at):
+        """Normalise a TransactionRecord or transaction dict into a transactions table row"""
+        if isinstance(transaction_data, TransactionRecord):
+            # Parser records are already normalised, copy their fields directly
+            return {
+                'merge_key': merge_key(transaction_data.transaction_id, transaction_data.date,
+                                       transaction_data.amount, transaction_data.body),
+                'transaction_id': transaction_data.transaction_id,
+                'date': transaction_data.date,
+                'amount': transaction_data.amount,
+                'fee': transaction_data.fee,
+                'balance': transaction_data.balance or None,
+                'category': transaction_data.category,
+                'recipient_name': transaction_data.recipient_name,
+                'recipient_number': transaction_data.recipient_number,
+                'sender_name': transaction_data.sender_name,
+                'sender_number': transaction_data.sender_number,
+                'message': transaction_data.message,
+                'raw_body': transaction_data.body,
+                'created_at': created_at
+            }
+        
+        # Convert datetime string to datetime object if needed
+        if isinstance(transaction_data.get('date'), str):
+            try:
+                transaction_data['date'] = datetime.fromisoformat(transaction_data['date'].replace('Z', '+00:00'))
+            except ValueError:
+                transaction_data['date'] = datetime.now()
+        
+        row = {
+            'transaction_id': transaction_data.get('transaction_id'),
+            'date': transaction_data.get('date', datetime.now()),
+            'amount': float(transaction_data.get('amount', 0)),
+            'fee': float(transaction_data.get('fee', 0)),
+            'balance': float(transaction_data.get('balance')) if transaction_data.get('balance') else None,
+            'category': transaction_data.get('category', 'unknown'),
+            'recipient_name': transaction_data.get('recipient_name'),
+            'recipient_number': transaction_data.get('recipient_number'),
+            'sender_name': transaction_data.get('sender_name'),
+            'sender_number': transaction_data.get('sender_number'),
+            'message': transaction_data.get('message'),
+            'raw_body': transaction_data.get('raw_body', transaction_data.get('body')),
+            'created_at': created_at
+        }
+        row['merge_key'] = merge_key(row['transaction_id'], row['date'], row['amount'], row['raw_body'])
+        return row
+    
+    @staticmethod
+    def data_generation():
+        """Current generation of the transactions data"""
+        return _data_generation
+    
+    @staticmethod
+    def bump_data_generation():
+        """Mark the transactions data as changed, invalidating cached counts"""
+        global _data_generation, _data_updated_at
+        with _cache_lock:
+            _data_generation += 1
+            _data_updated_at = datetime.now()
+            _count_cache.clear()
+    
+    @staticmethod
+    def search_match(search):
+        """FTS5 MATCH expression for a search term, or None when the index cannot serve it"""
+        if not search or len(search) < SEARCH_INDEX_MIN_LENGTH or not DatabaseService.has_search_index():
+            return None
+        # Quoted as one phrase, which the trigram tokenizer matches as a substring
+        return '"' + search.replace('"', '""') + '"'
+    
+    @staticmethod
+    def filtered_transactions(category=None, search=None, ranked=False):
+        """Query for transactions matching the category and search filters
+
+        With ``ranked`` a full-text search is joined to the search index so
+        results can be ordered by ``search_index.c.rank``.
+        """
+        query = Transaction.query
+        
+        # Filter by category
+        if category and category != 'all':
+            query = query.filter(Transaction.category == category)
+        
+        # Search filter, through the full-text index when possible
+        match = DatabaseService.search_match(search)
+        if match and (ranked or DatabaseService.count_search_matches(match) <
+                      DatabaseService.count_transactions() * SEARCH_SCAN_MIN_SHARE):
+            # Few matches: read them from the search index and sort them
+            query = query.join(search_index, search_index.c.rowid == Transaction.id).filter(
+                text('transactions_fts MATCH :search_match').bindparams(search_match=match)
+            )
+        elif match:
+            # Many matches: walk the date order and keep rows in the match set, the + stops
+            # SQLite from driving the query through the id lookup instead
+            query = query.filter(text(
+                '+transactions.id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH :search_match)'
+            ).bindparams(search_match=match))
+        elif search:
+            search_term = f"%{search}%"
+            query = query.filter(
+                db.or_(
+                    Transaction.recipient_name.like(search_term),
+                    Transaction.sender_name.like(search_term),
+                    Transaction.message.like(search_term),
+                    Transaction.category.like(search_term),
+                    Transaction.transaction_id.like(search_term)
                 )
+            )
+        
+        return query
+    
+    @staticmethod
+    def count_transactions(category=None, search=None):
+        """Count transactions matching the filters, cached until the next ingest"""
+        category = category if category and category != 'all' else None
+        match = DatabaseService.search_match(search)
+        if match and category is None:
+            # Every indexed row is a transaction, so the index alone can count
+            return DatabaseService.count_search_matches(match)
+        
+        return DatabaseService._cached_count(
+            (category, search or None),
+            lambda: DatabaseService.filtered_transactions(category, search).order_by(None).count()
+        )
+    
+    @staticmethod
+    def count_search_matches(match):
+        """Count rows of the search index matching a MATCH expression, cached until the next ingest"""
+        statement = text('SELECT count(*) FROM transactions_fts WHERE transactions_fts MATCH :search_match')
+        return DatabaseService._cached_count(
+            ('match', match),
+            lambda: db.session.execute(statement, {'search_match': match}).scalar()
+        )
+    
+    @staticmethod
+    def _cached_count(key, count):
+        """Return the cached count for ``key``, calling ``count()`` and caching it on a miss"""
+        with _cache_lock:
+            generation = _data_generation
+            total = _count_cache.get(key)
+        if total is not None:
+            return total
+        
+        total = count()
+        
+        with _cache_lock:
+            # Drop counts taken while an ingest committed
+            if generation == _data_generation:
+                if len(_count_cache) >= COUNT_CACHE_MAX_FILTERS:
+                    _count_cache.clear()
+                _count_cache[key] = total
+        return total
+    
+    @staticmethod
+    def get_all_transactions(page=1, per_page=20, category=None, search=None, sort='date'):
+        """Get paginated transactions with optional filtering
+
+        ``sort='relevance'`` orders search results by full-text rank (bm25)
+        when the search index serves the term; otherwise newest first.
+        """
+        try:
+            ranked = sort == 'relevance' and DatabaseService.search_match(search) is not None
+            query = DatabaseService.filtered_transactions(category, search, ranked=ranked)
             
-            # Order by date (newest first)
-            query = query.order_by(desc(Transaction.date))
+            if ranked:
+                query = query.order_by(search_index.c.rank, desc(Transaction.date))
+            else:
+                # Order by date (newest first)
+                query = query.order_by(desc(Transaction.date))
             
-            # Paginate
+            # Paginate, taking the total from the count cache
             pagination = query.paginate(
                 page=page, 
                 per_page=per_page, 
-                error_out=False
+                error_out=False,
+                count=False
             )
+            total = DatabaseService.count_transactions(category, search)
             
             return {
                 'transactions': [t.to_dict() for t in pagination.items],
-                'total': pagination.total,
-                'pages': pagination.pages,
+                'total': total,
+                'pages': math.ceil(total / per_page),
                 'current_page': page,
                 'per_page': per_page
             }
-            
+        
         except SQLAlchemyError as e:
             print(f"Database error: {e}")
+            raise
+    
+    @staticmethod
+    def get_merge_keys():
+        """Return the merge keys of all stored transactions as a set of integers"""
+        query = db.session.query(Transaction.merge_key).filter(Transaction.merge_key.isnot(None))
+        return {int(key, 16) for (key,) in query.yield_per(50000)}
+    
+    @staticmethod
+    def encode_cursor(transaction):
+        """Opaque page cursor pointing just after a transaction in (date, id) order"""
+        position = json.dumps([transaction.date.isoformat(), transaction.id])
+        return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        """Return the (date, id) position of a cursor, raising ValueError if it is malformed"""
+        try:
+            date, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return datetime.fromisoformat(date), int(row_id)
+        except (TypeError, ValueError, UnicodeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+    
+    @staticmethod
+    def get_transactions_page(cursor=None, per_page=20, category=None, search=None):
+        """Get a page of transactions newest first, continuing after ``cursor``
+
+        Keyset pagination on (date, id): each page seeks straight to its
+        first row through the date indexes instead of skipping an OFFSET, so
+        deep pages are as fast as the first. ``next_cursor`` is None on the
+        last page. Raises ValueError for a malformed cursor.
+        """
+        query = DatabaseService.filtered_transactions(category, search)
+        
+        if cursor:
+            date, row_id = DatabaseService.decode_cursor(cursor)
+            # The date range alone can use the index, the tie-break on id filters within it
+            query = query.filter(
+                Transaction.date <= date,
+                db.or_(Transaction.date < date, Transaction.id < row_id)
+            )
+        
+        try:
+            # One extra row tells whether another page follows
+            rows = query.order_by(desc(Transaction.date), desc(Transaction.id)).limit(per_page + 1).all()
+            has_more = len(rows) > per_page
+            rows = rows[:per_page]
+            
             return {
-                'transactions': [],
-                'total': 0,
-                'pages': 1,
-                'current_page': 1,
-                'per_page': per_page
+                'transactions': [t.to_dict() for t in rows],
+                'total': DatabaseService.count_transactions(category, search),
+                'per_page': per_page,
+                'next_cursor': DatabaseService.encode_cursor(rows[-1]) if has_more else None
             }
+        
+        except SQLAlchemyError as e:
+            print(f"Database error: {e}")
+            raise
     
     @staticmethod
-    def clear_transactions():
+    def clear_transactions(commit=True):
         """Clear all transactions from database"""
         try:
+            if DatabaseService.has_search_index():
+                db.session.execute(text("INSERT INTO transactions_fts (transactions_fts) VALUES ('delete-all')"))
             Transaction.query.delete()
-            db.session.commit()
+            for rollup in (CategoryRollup, MonthlyRollup, DailyRollup):
+                rollup.query.delete()
+            # High-water marks describe data that is no longer there
+            SourceWatermark.query.delete()
+            if commit:
+                db.session.commit()
+                DatabaseService.bump_data_generation()
             return True
         except SQLAlchemyError as e:
             db.session.rollback()
             print(f"Error clearing transactions: {e}")
             raise
     
+    @staticmethod
+    def get_watermark(source=DEFAULT_SOURCE):
+        """Get the latest ingested SMS date (epoch ms) for a backup source, or None"""
+        try:
+            watermark = SourceWatermark.query.filter_by(source=source).first()
+            return watermark.last_sms_date if watermark else None
+        
+        except SQLAlchemyError as e:
+            print(f"Database error: {e}")
+            return None
+    
+    @staticmethod
+    def set_watermark(source, last_sms_date):
+        """Record the latest ingested SMS date (epoch ms) for a backup source"""
+        try:
+            watermark = SourceWatermark.query.filter_by(source=source).first()
+            if watermark is None:
+                watermark = SourceWatermark(source=source)
+                db.session.add(watermark)
+            
+            watermark.last_sms_date = max(last_sms_date, watermark.last_sms_date or 0)
+            db.session.commit()
+            return watermark.last_sms_date
+        
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            print(f"Error updating watermark: {e}")
+            raise
+    
     @staticmethod
     def get_stats():
-        """Get transaction statistics"""
+        """Get transaction statistics from the category rollups"""
         try:
-            total_transactions = Transaction.query.count()
+            category_stats = CategoryRollup.query.order_by(CategoryRollup.category).all()
+            total_transactions = sum(rollup.count for rollup in category_stats)
             
             if total_transactions == 0:
                 return {
@@ -134,63 +604,44 @@ class DatabaseService:
                     'total_amount': 0,
                     'total_fees': 0,
                     'categories': {},
-                    'last_updated': datetime.now().isoformat()
+                    'last_updated': _data_updated_at.isoformat()
                 }
             
-            # Calculate totals
-            totals = db.session.query(
-                func.sum(Transaction.amount).label('total_amount'),
-                func.sum(Transaction.fee).label('total_fees')
-            ).first()
-            
             # Category breakdown
-            category_stats = db.session.query(
-                Transaction.category,
-                func.count(Transaction.id).label('count'),
-                func.sum(Transaction.amount).label('amount'),
-                func.sum(Transaction.fee).label('fees')
-            ).group_by(Transaction.category).all()
-            
             categories = {}
-            for cat, count, amount, fees in category_stats:
-                categories[cat] = {
-                    'count': count,
-                    'amount': float(amount or 0),
-                    'fees': float(fees or 0)
+            for rollup in category_stats:
+                categories[rollup.category] = {
+                    'count': rollup.count,
+                    'amount': float(rollup.amount or 0),
+                    'fees': float(rollup.fees or 0)
                 }
             
             return {
                 'total_transactions': total_transactions,
-                'total_amount': float(totals.total_amount or 0),
-                'total_fees': float(totals.total_fees or 0),
+                'total_amount': sum(category['amount'] for category in categories.values()),
+                'total_fees': sum(category['fees'] for category in categories.values()),
                 'categories': categories,
-                'last_updated': datetime.now().isoformat()
+                'last_updated': _data_updated_at.isoformat()
             }
-            
+        
         except SQLAlchemyError as e:
             print(f"Database error: {e}")
-            return {
-                'total_transactions': 0,
-                'total_amount': 0,
-                'total_fees': 0,
-                'categories': {},
-                'last_updated': datetime.now().isoformat()
-            }
+            raise
     
     @staticmethod
     def get_monthly_stats():
-        """Get monthly transaction statistics"""
+        """Get monthly transaction statistics from the monthly rollups"""
         try:
             monthly_data = db.session.query(
-                extract('year', Transaction.date).label('year'),
-                extract('month', Transaction.date).label('month'),
-                func.count(Transaction.id).label('count'),
-                func.sum(Transaction.amount).label('total_amount'),
-                func.sum(Transaction.fee).label('total_fees')
+                MonthlyRollup.year,
+                MonthlyRollup.month,
+                func.sum(MonthlyRollup.count).label('count'),
+                func.sum(MonthlyRollup.amount).label('total_amount'),
+                func.sum(MonthlyRollup.fees).label('total_fees')
             ).group_by(
-                extract('year', Transaction.date),
-                extract('month', Transaction.date)
-            ).order_by('year', 'month').all()
+                MonthlyRollup.year,
+                MonthlyRollup.month
+            ).order_by(MonthlyRollup.year, MonthlyRollup.month).all()
             
             result = []
             for year, month, count, total_amount, total_fees in monthly_data:
@@ -203,19 +654,33 @@ class DatabaseService:
                 })
             
             return result
+        
+        except SQLAlchemyError as e:
+            print(f"Database error: {e}")
+            raise
+    
+    @staticmethod
+    def get_daily_stats(days=None):
+        """Get daily transaction statistics from the daily rollups, limited to the latest ``days`` days"""
+        try:
+            query = DailyRollup.query.order_by(desc(DailyRollup.day))
+            if days:
+                query = query.limit(days)
             
+            return [rollup.to_dict() for rollup in reversed(query.all())]
+        
         except SQLAlchemyError as e:
             print(f"Database error: {e}")
-            return []
+            raise
     
     @staticmethod
     def get_category_distribution():
         """Get category distribution for charts"""
         try:
             categories = db.session.query(
-                Transaction.category,
-                func.count(Transaction.id).label('count')
-            ).group_by(Transaction.category).all()
+                CategoryRollup.category,
+                CategoryRollup.count
+            ).order_by(CategoryRollup.category).all()
             
             return [
                 {
@@ -224,27 +689,30 @@ class DatabaseService:
                 }
                 for cat, count in categories
             ]
-            
+        
         except SQLAlchemyError as e:
             print(f"Database error: {e}")
-            return []
+            raise
     
     @staticmethod
-    def add_upload_record(filename, total_messages=0, processed_messages=0, status='pending'):
+    def add_upload_record(filename, total_messages=0, processed_messages=0, status='pending', content_hash=None,
+                          batch_id=None):
         """Add upload history record"""
         try:
             upload = UploadHistory(
                 filename=filename,
                 total_messages=total_messages,
                 processed_messages=processed_messages,
-                status=status
+                status=status,
+                content_hash=content_hash,
+                batch_id=batch_id
             )
             
             db.session.add(upload)
             db.session.commit()
             
             return upload.id
-            
+        
         except SQLAlchemyError as e:
             db.session.rollback()
             print(f"Error adding upload record: {e}")
@@ -264,12 +732,65 @@ class DatabaseService:
                 return True
             
             return False
-            
+        
         except SQLAlchemyError as e:
             db.session.rollback()
             print(f"Error updating upload record: {e}")
             raise
     
+    @staticmethod
+    def find_loaded_upload(content_hash):
+        """Return the upload whose data is currently loaded if it has this content hash
+
+        Each ingest replaces the stored transactions, so the latest finished
+        upload describes what is in the database as long as the transaction
+        count still matches it.
+        """
+        try:
+            latest = UploadHistory.query.filter(
+                UploadHistory.status.in_(['completed', 'unchanged'])
+            ).order_by(desc(UploadHistory.id)).first()
+            
+            if latest is None or latest.content_hash != content_hash:
+                return None
+            
+            if Transaction.query.count() != latest.processed_messages:
+                return None
+            
+            return latest.to_dict()
+        
+        except SQLAlchemyError as e:
+            print(f"Database error: {e}")
+            return None
+    
+    @staticmethod
+    def find_resumable_upload(content_hash):
+        """Return the interrupted chunked ingest of this content hash if it can be resumed
+
+        Only the latest ingest can be resumed, since any later one changed
+        the stored transactions. Its ``processed_messages`` is the number of
+        transactions committed before it stopped.
+        """
+        try:
+            latest = UploadHistory.query.filter(
+                UploadHistory.status != 'unchanged'
+            ).order_by(desc(UploadHistory.id)).first()
+            
+            if latest is None or latest.content_hash != content_hash:
+                return None
+            
+            if latest.status not in ('failed', 'processing') or not latest.processed_messages:
+                return None
+            
+            if Transaction.query.count() < latest.processed_messages:
+                return None
+            
+            return latest.to_dict()
+        
+        except SQLAlchemyError as e:
+            print(f"Database error: {e}")
+            return None
+    
     @staticmethod
     def get_upload_history(limit=10):
         """Get upload history"""
@@ -279,24 +800,25 @@ class DatabaseService:
             ).limit(limit).all()
             
             return [upload.to_dict() for upload in uploads]
-            
+        
         except SQLAlchemyError as e:
             print(f"Database error: {e}")
             return []
     
     @staticmethod
     def detect_xml_files():
-        """Detect XML files in the data directory"""
-        xml_files = []
+        """Detect XML files (plain or compressed) in the data directory"""
+        xml_files = set()
         
         # Look for XML files in data directory and subdirectories
-        patterns = [
-            os.path.join('data', '*.xml'),
-            os.path.join('data', '**', '*.xml')
-        ]
-        
-        for pattern in patterns:
-            xml_files.extend(glob.glob(pattern, recursive=True))
+        for backup_pattern in BACKUP_FILE_PATTERNS:
+            patterns = [
+                os.path.join('data', backup_pattern),
+                os.path.join('data', '**', backup_pattern)
+            ]
+            
+            for pattern in patterns:
+                xml_files.update(glob.glob(pattern, recursive=True))
         
         # Return file info
         file_info = []
@@ -326,7 +848,7 @@ class DatabaseService:
         try:
             categories = db.session.query(Transaction.category).distinct().all()
             return [cat[0] for cat in categories]
-            
+        
         except SQLAlchemyError as e:
             print(f"Database error: {e}")
             return []
\ No newline at end of file
@@ -15,6 +15,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import create_app, db
 from app.models import Transaction, UploadHistory
+from app.database import DatabaseService
 
 def init_database():
     """Initialize the database with all required tables"""
@@ -71,21 +72,19 @@ def init_database():
             # Add some sample data for testing (optional)
             add_sample = input("\n🎯 Add sample transaction for testing? (y/N): ").lower()
             if add_sample in ['y', 'yes']:
-                sample_transaction = Transaction(
-                    transaction_id="TEST001",
-                    date=datetime.now(),
-                    amount=1000.0,
-                    fee=50.0,
-                    balance=5000.0,
-                    category="incoming_money",
-                    recipient_name="Test User",
-                    sender_name="Sample Sender",
-                    message="Test transaction",
-                    raw_body="Test SMS: You have received 1000 RWF from Sample Sender"
-                )
-                
-                db.session.add(sample_transaction)
-                db.session.commit()
+                # Through the service so the row gets its merge key and search index entry
+                DatabaseService.add_multiple_transactions([{
+                    'transaction_id': "TEST001",
+                    'date': datetime.now(),
+                    'amount': 1000.0,
+                    'fee': 50.0,
+                    'balance': 5000.0,
+                    'category': "incoming_money",
+                    'recipient_name': "Test User",
+                    'sender_name': "Sample Sender",
+                    'message': "Test transaction",
+                    'raw_body': "Test SMS: You have received 1000 RWF from Sample Sender"
+                }])
                 print("✅ Sample transaction added")
             
             print("\n🎉 Database initialization complete!")
@@ -147,10 +146,13 @@ def reset_database():
     with app.app_context():
         try:
             print("🗑️  Dropping all tables...")
+            DatabaseService.drop_search_index()
             db.drop_all()
             
             print("🏗️  Recreating tables...")
             db.create_all()
+            # Recreate the indexes, rollups and search index that create_all() does not know about
+            DatabaseService.upgrade_schema()
             
             print("✅ Database reset complete!")
             
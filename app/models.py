@@ -3,6 +3,14 @@ from . import db
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Newest-first listing and cursor paging; SQLite appends the id, which breaks date ties
+        db.Index('ix_transactions_date', 'date'),
+        # Category-filtered listing in date order
+        db.Index('ix_transactions_category_date', 'category', 'date'),
+        # One row per transaction id, or per date, amount and body when there is no id
+        db.Index('ux_transactions_merge_key', 'merge_key', unique=True)
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     transaction_id = db.Column(db.String(50))
@@ -18,6 +26,7 @@ class Transaction(db.Model):
     message = db.Column(db.Text)
     raw_body = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    merge_key = db.Column(db.String(32))  # See database.merge_key
     
     def __repr__(self):
         return f'<Transaction {self.id}: {self.category} - {self.amount} RWF>'
@@ -49,6 +58,9 @@ class UploadHistory(db.Model):
     processed_messages = db.Column(db.Integer, default=0)
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(50), default='pending')
+    content_hash = db.Column(db.String(64), index=True)
+    batch_id = db.Column(db.String(32), index=True)  # Set for files ingested together in one batch
+    duplicate_messages = db.Column(db.Integer, default=0)  # Transactions already present in another file of the batch
     
     def __repr__(self):
         return f'<UploadHistory {self.id}: {self.filename} - {self.status}>'
@@ -60,5 +72,73 @@ class UploadHistory(db.Model):
             'total_messages': self.total_messages,
             'processed_messages': self.processed_messages,
             'upload_date': self.upload_date.isoformat() if self.upload_date else None,
-            'status': self.status
+            'status': self.status,
+            'content_hash': self.content_hash,
+            'batch_id': self.batch_id,
+            'duplicate_messages': self.duplicate_messages
+        }
+
+class SourceWatermark(db.Model):
+    __tablename__ = 'source_watermarks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(255), unique=True, nullable=False)
+    last_sms_date = db.Column(db.BigInteger, nullable=False, default=0)  # Epoch milliseconds
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SourceWatermark {self.source}: {self.last_sms_date}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'source': self.source,
+            'last_sms_date': self.last_sms_date,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class CategoryRollup(db.Model):
+    """Transaction totals per category, kept up to date by DatabaseService on insert and clear"""
+    __tablename__ = 'category_rollups'
+    
+    category = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    fees = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<CategoryRollup {self.category}: {self.count}>'
+
+class MonthlyRollup(db.Model):
+    """Transaction totals per month and category"""
+    __tablename__ = 'monthly_rollups'
+    
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    fees = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<MonthlyRollup {self.year}-{self.month:02d} {self.category}: {self.count}>'
+
+class DailyRollup(db.Model):
+    """Transaction totals per day"""
+    __tablename__ = 'daily_rollups'
+    
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    fees = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<DailyRollup {self.day}: {self.count}>'
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat() if self.day else None,
+            'count': self.count,
+            'amount': self.amount,
+            'fees': self.fees
         }
\ No newline at end of file
@@ -1,95 +1,586 @@
 import re
+import codecs
+import hashlib
+import gzip
+import bz2
+import zipfile
+import zlib
 from datetime import datetime
 from lxml import etree
 import os
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from .profiler import PatternProfiler
+from .records import TransactionRecord
+
+# Files at least this large once decompressed are parsed in parallel unless a worker count is given
+PARALLEL_MIN_FILE_SIZE = 8 * 1024 * 1024
+# Parser processes start from a fork server (or are spawned where there is none), since forking the
+# threaded Flask process would copy locks held by its other threads into the children
+PARALLEL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# Number of MoMo messages sent to a worker process at a time
+PARALLEL_BATCH_SIZE = 2000
+# Streamed parses with more transactions than this are not added to the parse cache
+PARSE_CACHE_MAX_RECORDS = 200000
+
+# Sender addresses whose messages are treated as MoMo transactions
+MOMO_ADDRESSES = ('m-money', 'mtn mobile money', 'momo')
+# Bytes read per chunk when pre-filtering a backup
+PREFILTER_CHUNK_SIZE = 1024 * 1024
+# Declared encodings whose bytes the pre-filter can scan; other backups are read with iterparse
+PREFILTER_ENCODINGS = ('utf-8', 'utf8', 'us-ascii', 'ascii')
+
+# File names of SMS backups, plain or compressed
+BACKUP_FILE_PATTERNS = ('*.xml', '*.xml.gz', '*.xml.bz2', '*.zip')
+# Magic numbers of the compressed formats read by open_backup
+GZIP_MAGIC = b'\x1f\x8b'
+BZIP2_MAGIC = b'BZh'
+ZIP_MAGIC = b'PK\x03\x04'
+# bzip2 does not record the decompressed size; SMS backups shrink about 15-20 times
+BZIP2_SIZE_RATIO = 15
+# Errors raised by the decompressors for a damaged, encrypted or unsupported archive; bzip2 reports
+# a damaged stream as a plain OSError, so reads of compressed backups are wrapped (see DamagedBackupError)
+_DECOMPRESSOR_ERRORS = (OSError, EOFError, zlib.error, RuntimeError, NotImplementedError)
+
+# Raw byte patterns used to pre-filter backups before XML decoding
+_PROLOG_ITEM = re.compile(rb'\s*(?:<\?.*?\?>|<!--.*?-->|<!DOCTYPE[^>\[]*(?:\[.*?\])?\s*>)', re.DOTALL)
+_XML_ENCODING = re.compile(rb'<\?xml\s[^>]*?encoding\s*=\s*(["\'])(.*?)\1')
+_ROOT_TAG = re.compile(rb'\s*<([A-Za-z_][\w.:-]*)[^>]*>')
+_SMS_START = re.compile(rb'<sms[\s/>]')
+# Rest of an <sms> start tag up to its closing '>', skipping '>' inside single or double quoted values
+_SMS_TAG_REST = re.compile(rb'[^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*>')
+
+# Category patterns in priority order: the first category with a matching
+# pattern wins, so more specific categories must come first.
+CATEGORIES = {
+    'incoming_money': [
+        r'You have received.*RWF from',
+        r'received.*RWF.*from',
+        r'incoming.*payment.*from'
+    ],
+    'payment_to_code': [
+        r'Your payment of.*RWF to.*\d{5} has been completed',
+        r'payment.*completed.*code.*\d{5}',
+        r'sent.*RWF.*to.*\d{5}'
+    ],
+    'transfer_to_number': [
+        r'transferred to.*\(250\d+\)',
+        r'sent.*RWF.*to.*\(\d+\)',
+        r'transfer.*completed.*to.*\d+'
+    ],
+    'bank_deposit': [
+        r'bank deposit of.*RWF has been added',
+        r'deposit.*bank.*RWF',
+        r'bank.*transaction.*deposit'
+    ],
+    'airtime_payment': [
+        r'Your payment of.*RWF to Airtime',
+        r'airtime.*purchase.*RWF',
+        r'payment.*airtime.*completed'
+    ],
+    'cash_power': [
+        r'Your payment of.*RWF to.*Cash Power',
+        r'cash power.*purchase.*RWF',
+        r'electricity.*payment.*RWF'
+    ],
+    'third_party_initiated': [
+        r'initiated by third party',
+        r'third party.*transaction',
+        r'external.*initiated'
+    ],
+    'withdrawal_from_agent': [
+        r'withdrawn.*RWF.*via agent',
+        r'cash.*withdrawal.*agent',
+        r'agent.*withdrawal.*RWF'
+    ],
+    'bank_transfer': [
+        r'Bank Transfer.*completed',
+        r'transfer.*bank.*completed',
+        r'bank.*transaction.*transfer'
+    ],
+    'internet_voice_bundle': [
+        r'Internet.*Voice Bundle.*purchased',
+        r'bundle.*internet.*voice',
+        r'data.*bundle.*purchased'
+    ],
+    'fees_and_charges': [
+        r'fee.*charged',
+        r'service.*charge',
+        r'transaction.*fee'
+    ],
+    'balance_inquiry': [
+        r'balance.*inquiry',
+        r'check.*balance',
+        r'account.*balance'
+    ]
+}
+
+
+# Field extraction patterns, tried in order; the first one that matches wins
+FIELD_PATTERNS = {
+    'amount': [
+        r'(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',  # Standard format
+        r'of\s+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',  # "of X RWF"
+        r'received\s+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',  # "received X RWF"
+        r'sent\s+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',  # "sent X RWF"
+        r'withdrawn\s+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',  # "withdrawn X RWF"
+        r'deposited\s+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF'  # "deposited X RWF"
+    ],
+    'fee': [
+        r'Fee\s*(?:was|:)?\s*(\d+(?:\.\d+)?)\s*RWF',
+        r'fee\s*(?:of)?\s*(\d+(?:\.\d+)?)\s*RWF',
+        r'charge\s*(?:of)?\s*(\d+(?:\.\d+)?)\s*RWF'
+    ],
+    'balance': [
+        r'balance[:\s]+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',
+        r'NEW BALANCE\s*:?\s*(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',
+        r'current.*balance.*?(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',
+        r'remaining.*balance.*?(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF'
+    ],
+    'transaction_id': [
+        r'TxId:\s*(\w+)',
+        r'Transaction Id:\s*(\w+)',
+        r'Financial Transaction Id:\s*(\w+)',
+        r'Ref:\s*(\w+)',
+        r'Reference:\s*(\w+)'
+    ],
+    'recipient': [
+        r'to\s+([A-Za-z\s]+)\s+(\d{5})',  # Payments to code holders
+        r'to\s+([A-Za-z\s]+)\s*\((\d+)\)',  # Transfers to phone numbers
+        r'from\s+([A-Za-z\s]+)\s*\(\*+(\d+)\)',  # Incoming money
+        r'agent\s+([A-Za-z\s]+)\s*\((\d+)\)',  # Agent transactions
+        r'recipient\s+([A-Za-z\s]+)\s*\((\d+)\)'  # Generic recipient
+    ],
+    'sender': [
+        r'from\s+([A-Za-z\s]+)\s*\(\*+(\d+)\)',
+        r'sender\s+([A-Za-z\s]+)\s*\((\d+)\)',
+        r'initiated by\s+([A-Za-z\s]+)\s*\((\d+)\)'
+    ],
+    'message': [
+        r'message[:\s]+"([^"]+)"',
+        r'memo[:\s]+"([^"]+)"',
+        r'note[:\s]+"([^"]+)"'
+    ]
+}
+
+
+def _leading_keyword(pattern):
+    """Return the lowercase literal every match of ``pattern`` starts with.
+
+    Returns None when the pattern has no plain leading literal (or a top-level
+    alternation), in which case it can not be skipped by keyword lookup.
+    """
+    depth = 0
+    for char in pattern:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return None
+    
+    match = re.match(r'[A-Za-z][A-Za-z ]*:?', pattern)
+    if not match:
+        return None
+    
+    literal = match.group(0)
+    # A quantifier after the literal makes its last character optional
+    if pattern[match.end():match.end() + 1] in ('?', '*', '{'):
+        literal = literal[:-1]
+    return literal.lower() or None
+
+
+def _compile_keyword_patterns(table):
+    """Precompile each pattern list of a category or field table alongside the patterns' leading keywords"""
+    return {
+        key: [(re.compile(pattern, re.IGNORECASE), _leading_keyword(pattern)) for pattern in patterns]
+        for key, patterns in table.items()
+    }
+
+
+def _class_end(pattern, start):
+    """Index just past the character class starting at ``start``"""
+    i = start + 1
+    if pattern[i] == '^':
+        i += 1
+    if pattern[i] == ']':
+        i += 1
+    while pattern[i] != ']':
+        i += 2 if pattern[i] == '\\' else 1
+    return i + 1
+
+
+def _required_literals(pattern):
+    """Return the literal runs every match of ``pattern`` contains.
+
+    Each run is ``(text, spaced)``, where ``spaced`` is True when the pattern
+    requires whitespace right after the run (as in ``to\s+``). Only text
+    outside groups and character classes counts, a quantifier that makes a
+    character optional ends the run before it, and a pattern with a
+    top-level alternation has no required runs.
+    """
+    literals, run = _scan_literals(pattern)
+    if run.strip():
+        literals.append((run, False))
+    return literals
+
+
+def _scan_literals(pattern):
+    """Split ``pattern`` into required literal runs, returning the closed runs and the one it ends with"""
+    literals = []
+    run = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        spaced = False
+        if char == '\\':
+            escaped = pattern[i + 1]
+            i += 2
+            if not escaped.isalnum():
+                run += escaped
+                continue
+            spaced = escaped == 's' and pattern[i:i + 1] == '+'
+        elif char == '[':
+            i = _class_end(pattern, i)
+        elif char == '(':
+            # Skip the group, including nested groups and the classes in it
+            depth = 0
+            while True:
+                if pattern[i] == '\\':
+                    i += 2
+                    continue
+                if pattern[i] == '[':
+                    i = _class_end(pattern, i)
+                    continue
+                if pattern[i] == '(':
+                    depth += 1
+                elif pattern[i] == ')':
+                    depth -= 1
+                    if not depth:
+                        break
+                i += 1
+            i += 1
+        elif char in '?*{':
+            # The quantified character may be absent (or repeated), so the run ends before it
+            run = run[:-1]
+            i = pattern.index('}', i) + 1 if char == '{' else i + 1
+        elif char == '|':
+            return [], ''
+        elif char in '+.^$':
+            i += 1
+        else:
+            run += char
+            i += 1
+            continue
+        
+        if run.strip():
+            literals.append((run, spaced))
+        run = ''
+    
+    return literals, run
+
+
+def _template_guard(template):
+    """Regex finding text in a template's names and free text that could change what the cascade extracts.
+
+    Only categories ranked above the template's own can change its category,
+    while every field pattern can change a field. A pattern with a required
+    run missing from the template's fixed text can not match unless that run
+    is written into a name or free text, so that run alone is rejected;
+    otherwise all of the pattern's runs are.
+    """
+    fixed = [text.lower() for text, _ in _required_literals(template['pattern'])]
+    # Literal text a name or free text directly follows
+    leading = [
+        _scan_literals(template['pattern'][:segment.start()])[1].lower()
+        for segment in re.finditer(r'\(\?P<(?:\w+_name|free_text)>', template['pattern'])
+    ]
+    categories = list(CATEGORIES)
+    deciding = [
+        pattern
+        for category in categories[:categories.index(template['category'])]
+        for pattern in CATEGORIES[category]
+    ]
+    deciding += [pattern for patterns in FIELD_PATTERNS.values() for pattern in patterns]
+    
+    guarded = set()
+    for pattern in deciding:
+        literals = _required_literals(pattern)
+        if not literals:
+            raise ValueError(f"Pattern '{pattern}' has no literal text a template can guard against")
+        absent = [literal for literal in literals if not any(literal[0].lower() in text for text in fixed)]
+        guarded.update([max(absent, key=lambda literal: len(literal[0]))] if absent else literals)
+    
+    words = set()
+    reach = 0
+    for text, spaced in guarded:
+        suffix = r'\s' if spaced else ''
+        words.add(re.escape(text.lower()) + suffix)
+        # A run can also start in the fixed text just before a name or free text
+        for length in range(1, len(text)):
+            if any(leading_text.endswith(text[:length].lower()) for leading_text in leading):
+                words.add(re.escape(text[length:].lower()) + suffix)
+        reach = max(reach, len(text) + len(suffix))
+    return re.compile('|'.join(sorted(words))), reach
+
+
+# Known MTN MoMo message formats. A body starting with ``prefix`` is parsed by
+# the anchored ``pattern`` alone; its named groups map straight onto transaction
+# fields. Bodies that start with no known prefix, or that deviate from the
+# template, fall back to the generic category/extractor cascade. Each template
+# reproduces what the generic cascade extracts from the same message: names
+# (``*_name`` groups) and free text (the ``free_text`` group, the sender's
+# message or trailing text) may not contain text that could change what the
+# cascade extracts (see _template_guard), so those bodies fall back as well.
+_NUMBER = r'\d+(?:,\d+)*(?:\.\d+)?'
+_NAME = r'[A-Za-z][A-Za-z ]*?'
+_TIMESTAMP = r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}'
+_TAIL = r'(?P<free_text>[^"()]*)'
+
+MESSAGE_TEMPLATES = [
+    {
+        'name': 'incoming_money',
+        'prefix': 'You have received ',
+        'category': 'incoming_money',
+        'pattern': (
+            r'You have received (?P<amount>' + _NUMBER + r') RWF from (?P<sender_name>' + _NAME + r') '
+            r'\(\*+(?P<sender_number>\d+)\) on your mobile money account at ' + _TIMESTAMP + r'\. '
+            r'Message from sender: (?P<free_text>[^"()]*?)\. Your new balance:(?P<balance>' + _NUMBER + r') RWF\. '
+            r'Financial Transaction Id: (?P<transaction_id>\w+)\.$'
+        ),
+        # The generic extractor reads the sender as the recipient too
+        'aliases': {'recipient_name': 'sender_name', 'recipient_number': 'sender_number'}
+    },
+    {
+        'name': 'payment_to_code',
+        'prefix': 'TxId: ',
+        'category': 'payment_to_code',
+        'pattern': (
+            r'TxId: (?P<transaction_id>\w+)\. Your payment of (?P<amount>' + _NUMBER + r') RWF '
+            r'to (?P<recipient_name>' + _NAME + r') (?P<recipient_number>\d{5}) has been completed '
+            r'at ' + _TIMESTAMP + r'\. Your new balance: (?P<balance>' + _NUMBER + r') RWF\. '
+            r'Fee was (?P<fee>\d+(?:\.\d+)?) RWF\.' + _TAIL + r'$'
+        )
+    },
+    {
+        'name': 'transfer_to_number',
+        'prefix': '*165*S*',
+        'category': 'transfer_to_number',
+        # "Fee was: X RWF" is not picked up by the generic fee patterns, so the
+        # fee is deliberately left at its default here as well
+        'pattern': (
+            r'\*165\*S\*(?P<amount>' + _NUMBER + r') RWF transferred to (?P<recipient_name>' + _NAME + r') '
+            r'\((?P<recipient_number>\d+)\) from \d+ at ' + _TIMESTAMP + r' \. Fee was: ' + _NUMBER + r' RWF\. '
+            r'New balance: (?P<balance>' + _NUMBER + r') RWF\.' + _TAIL + r'$'
+        )
+    },
+    {
+        'name': 'bank_deposit',
+        'prefix': '*113*R*A bank deposit of ',
+        'category': 'bank_deposit',
+        'pattern': (
+            r'\*113\*R\*A bank deposit of (?P<amount>' + _NUMBER + r') RWF has been added to your '
+            r'mobile money account at ' + _TIMESTAMP + r'\. Your NEW BALANCE :(?P<balance>' + _NUMBER + r') RWF\.'
+            + _TAIL + r'$'
+        )
+    }
+]
+
+
+def _compile_templates(templates):
+    """Compile the template registry into a prefix matcher, per-template patterns and their guards"""
+    prefix_matcher = re.compile('|'.join(
+        '(?P<%s>%s)' % (template['name'], re.escape(template['prefix'])) for template in templates
+    ))
+    patterns = {template['name']: re.compile(template['pattern']) for template in templates}
+    guards = {}
+    for template in templates:
+        guard, reach = _template_guard(template)
+        segments = tuple(
+            group for group in patterns[template['name']].groupindex
+            if group.endswith('_name') or group == 'free_text'
+        )
+        guards[template['name']] = (guard, reach, segments)
+    return prefix_matcher, patterns, guards
+
+
+# Compiled once per process and shared by every SMSParser instance
+CATEGORY_MATCHER = _compile_keyword_patterns(CATEGORIES)
+FIELD_EXTRACTOR = _compile_keyword_patterns(FIELD_PATTERNS)
+TEMPLATE_PREFIX_MATCHER, TEMPLATE_PATTERNS, TEMPLATE_GUARDS = _compile_templates(MESSAGE_TEMPLATES)
+
+# Changes whenever a pattern changes, so memoised parses can be invalidated
+PATTERN_FINGERPRINT = hashlib.sha256(
+    repr((CATEGORIES, FIELD_PATTERNS, MESSAGE_TEMPLATES)).encode('utf-8')
+).hexdigest()[:16]
+
+
+class XMLValidationError(ValueError):
+    """Raised when a file does not have the structure of an SMS backup"""
+
+
+class DamagedBackupError(Exception):
+    """Raised when a compressed backup cannot be decompressed"""
+
+
+# Errors raised while decompressing a damaged backup
+DECOMPRESSION_ERRORS = (gzip.BadGzipFile, zipfile.BadZipFile, zlib.error, EOFError, DamagedBackupError)
+
+
+class _CompressedBackup:
+    """Read-only file object over a decompressing stream that raises DamagedBackupError for bad data"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+    
+    def read(self, size=-1):
+        try:
+            return self.stream.read(size)
+        except _DECOMPRESSOR_ERRORS as e:
+            raise DamagedBackupError(str(e) or e.__class__.__name__) from e
+    
+    def close(self):
+        self.stream.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_backup(file_path):
+    """Open an SMS backup for binary reading, decompressing it on the fly
+    
+    gzip, bzip2 and zip files are recognised by their magic number, so the
+    file name does not matter. A zip archive is read from its first ``.xml``
+    member (or its only member). Nothing is decompressed to disk.
+    """
+    with open(file_path, 'rb') as f:
+        magic = f.read(4)
+    
+    if magic.startswith(GZIP_MAGIC):
+        return _CompressedBackup(gzip.open(file_path, 'rb'))
+    if magic.startswith(BZIP2_MAGIC):
+        return _CompressedBackup(bz2.open(file_path, 'rb'))
+    if magic.startswith(ZIP_MAGIC):
+        with zipfile.ZipFile(file_path) as archive:
+            member = _backup_member(archive)
+            # The member stays readable after the archive itself is closed
+            try:
+                return _CompressedBackup(archive.open(member))
+            except (RuntimeError, NotImplementedError) as e:
+                # Encrypted member or unsupported compression method
+                raise DamagedBackupError(str(e)) from e
+    return open(file_path, 'rb')
+
+
+def _backup_member(archive):
+    """The member of a zip archive holding the backup: its first ``.xml`` file, or its only file"""
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    xml_members = [info for info in members if info.filename.lower().endswith('.xml')]
+    if xml_members:
+        return xml_members[0]
+    if len(members) == 1:
+        return members[0]
+    raise XMLValidationError("Zip archive does not contain an XML backup")
+
+
+def backup_size(file_path):
+    """Size of an SMS backup in bytes once decompressed, estimated for bzip2 files"""
+    size = os.path.getsize(file_path)
+    try:
+        with open(file_path, 'rb') as f:
+            magic = f.read(4)
+            if magic.startswith(GZIP_MAGIC):
+                # The gzip trailer ends with the size of the last member modulo 2**32
+                f.seek(-4, os.SEEK_END)
+                return max(size, int.from_bytes(f.read(4), 'little'))
+        if magic.startswith(BZIP2_MAGIC):
+            return size * BZIP2_SIZE_RATIO
+        if magic.startswith(ZIP_MAGIC):
+            with zipfile.ZipFile(file_path) as archive:
+                return _backup_member(archive).file_size
+    except (OSError, zipfile.BadZipFile, XMLValidationError):
+        # Damaged archives are reported by the parse itself
+        pass
+    return size
+
+
+def parser_pool(workers):
+    """Process pool for parsing backups, started with PARALLEL_START_METHOD"""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(PARALLEL_START_METHOD))
+
 
 class SMSParser:
-    def __init__(self):
-        self.categories = {
-            'incoming_money': [
-                r'You have received.*RWF from',
-                r'received.*RWF.*from',
-                r'incoming.*payment.*from'
-            ],
-            'payment_to_code': [
-                r'Your payment of.*RWF to.*\d{5} has been completed',
-                r'payment.*completed.*code.*\d{5}',
-                r'sent.*RWF.*to.*\d{5}'
-            ],
-            'transfer_to_number': [
-                r'transferred to.*\(250\d+\)',
-                r'sent.*RWF.*to.*\(\d+\)',
-                r'transfer.*completed.*to.*\d+'
-            ],
-            'bank_deposit': [
-                r'bank deposit of.*RWF has been added',
-                r'deposit.*bank.*RWF',
-                r'bank.*transaction.*deposit'
-            ],
-            'airtime_payment': [
-                r'Your payment of.*RWF to Airtime',
-                r'airtime.*purchase.*RWF',
-                r'payment.*airtime.*completed'
-            ],
-            'cash_power': [
-                r'Your payment of.*RWF to.*Cash Power',
-                r'cash power.*purchase.*RWF',
-                r'electricity.*payment.*RWF'
-            ],
-            'third_party_initiated': [
-                r'initiated by third party',
-                r'third party.*transaction',
-                r'external.*initiated'
-            ],
-            'withdrawal_from_agent': [
-                r'withdrawn.*RWF.*via agent',
-                r'cash.*withdrawal.*agent',
-                r'agent.*withdrawal.*RWF'
-            ],
-            'bank_transfer': [
-                r'Bank Transfer.*completed',
-                r'transfer.*bank.*completed',
-                r'bank.*transaction.*transfer'
-            ],
-            'internet_voice_bundle': [
-                r'Internet.*Voice Bundle.*purchased',
-                r'bundle.*internet.*voice',
-                r'data.*bundle.*purchased'
-            ],
-            'fees_and_charges': [
-                r'fee.*charged',
-                r'service.*charge',
-                r'transaction.*fee'
-            ],
-            'balance_inquiry': [
-                r'balance.*inquiry',
-                r'check.*balance',
-                r'account.*balance'
-            ]
-        }
+    def __init__(self, momo_addresses=MOMO_ADDRESSES, prefilter=True, profile=False, body_cache=None):
+        self.momo_addresses = {address.lower() for address in momo_addresses}
+        # Raw address attributes the pre-filter decodes: the MoMo senders in any case, plus entity
+        # encoded or non-ASCII values, whose address is checked once decoded
+        self.momo_address_attr = re.compile(
+            rb'address\s*=\s*(["\'])(?:(?i:%s)|[^"\'&\x80-\xff]*[&\x80-\xff][^"\']*)\1'
+            % b'|'.join(re.escape(address.encode('utf-8')) for address in sorted(self.momo_addresses))
+        )
+        self.prefilter = prefilter
+        # Optional BodyCache memoising the fields parsed from each distinct body
+        self.body_cache = body_cache
+        self.profile = profile
+        # Pattern-by-pattern matching is only needed when profiling
+        self.profiler = PatternProfiler() if profile else None
+        self.category_patterns = {
+            category: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            for category, patterns in CATEGORIES.items()
+        } if profile else None
+        self.categories = CATEGORIES
+        self.category_matcher = CATEGORY_MATCHER
+        self.field_patterns = FIELD_PATTERNS
+        self.field_extractor = FIELD_EXTRACTOR
+        self.templates = {template['name']: template for template in MESSAGE_TEMPLATES}
+        self.template_prefix_matcher = TEMPLATE_PREFIX_MATCHER
+        self.template_patterns = TEMPLATE_PATTERNS
+        self.template_guards = TEMPLATE_GUARDS
+        self.template_hits = Counter()
+        self.max_sms_date = 0
+        self.sms_count = 0
     
     def categorize_transaction(self, body):
         """Categorize transaction based on message content"""
-        body_lower = body.lower()
+        if self.profiler is not None:
+            return self._categorize_profiled(body)
         
-        for category, patterns in self.categories.items():
-            for pattern in patterns:
-                if re.search(pattern, body, re.IGNORECASE):
+        # Patterns whose leading keyword is absent are skipped, as in extract_fields
+        body_lower = body.lower() if body.isascii() else None
+        for category, compiled_patterns in self.category_matcher.items():
+            for regex, keyword in compiled_patterns:
+                if keyword is None or body_lower is None:
+                    match = regex.search(body)
+                else:
+                    position = body_lower.find(keyword)
+                    if position < 0:
+                        continue
+                    match = regex.search(body, position)
+                
+                if match:
+                    return category
+        return 'other'
+    
+    def _categorize_profiled(self, body):
+        """Categorize with one search per pattern, timing each attempt"""
+        for category, patterns in self.category_patterns.items():
+            for index, regex in enumerate(patterns):
+                start = perf_counter()
+                match = regex.search(body)
+                self.profiler.record(f'category.{category}[{index}]', regex.pattern, match is not None,
+                                     perf_counter() - start, categorizing=True)
+                if match:
                     return category
         return 'other'
     
     def extract_amount(self, body):
         """Extract transaction amount from message"""
-        patterns = [
-            r'(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',  # Standard format
-            r'of\s+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',  # "of X RWF"
-            r'received\s+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',  # "received X RWF"
-            r'sent\s+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',  # "sent X RWF"
-            r'withdrawn\s+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',  # "withdrawn X RWF"
-            r'deposited\s+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF'  # "deposited X RWF"
-        ]
-        
-        for pattern in patterns:
+        for pattern in FIELD_PATTERNS['amount']:
             match = re.search(pattern, body, re.IGNORECASE)
             if match:
                 amount_str = match.group(1).replace(',', '')
@@ -101,13 +592,7 @@ class SMSParser:
     
     def extract_fee(self, body):
         """Extract transaction fee from message"""
-        fee_patterns = [
-            r'Fee\s*(?:was|:)?\s*(\d+(?:\.\d+)?)\s*RWF',
-            r'fee\s*(?:of)?\s*(\d+(?:\.\d+)?)\s*RWF',
-            r'charge\s*(?:of)?\s*(\d+(?:\.\d+)?)\s*RWF'
-        ]
-        
-        for pattern in fee_patterns:
+        for pattern in FIELD_PATTERNS['fee']:
             match = re.search(pattern, body, re.IGNORECASE)
             if match:
                 try:
@@ -118,14 +603,7 @@ class SMSParser:
     
     def extract_balance(self, body):
         """Extract balance from message"""
-        patterns = [
-            r'balance[:\s]+(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',
-            r'NEW BALANCE\s*:?\s*(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',
-            r'current.*balance.*?(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF',
-            r'remaining.*balance.*?(\d+(?:,\d+)*(?:\.\d+)?)\s*RWF'
-        ]
-        
-        for pattern in patterns:
+        for pattern in FIELD_PATTERNS['balance']:
             match = re.search(pattern, body, re.IGNORECASE)
             if match:
                 balance_str = match.group(1).replace(',', '')
@@ -137,15 +615,7 @@ class SMSParser:
     
     def extract_transaction_id(self, body):
         """Extract transaction ID from message"""
-        patterns = [
-            r'TxId:\s*(\w+)',
-            r'Transaction Id:\s*(\w+)',
-            r'Financial Transaction Id:\s*(\w+)',
-            r'Ref:\s*(\w+)',
-            r'Reference:\s*(\w+)'
-        ]
-        
-        for pattern in patterns:
+        for pattern in FIELD_PATTERNS['transaction_id']:
             match = re.search(pattern, body, re.IGNORECASE)
             if match:
                 return match.group(1)
@@ -153,20 +623,7 @@ class SMSParser:
     
     def extract_recipient_info(self, body):
         """Extract recipient name and number"""
-        recipient_patterns = [
-            # For payments to code holders
-            (r'to\s+([A-Za-z\s]+)\s+(\d{5})', 'code'),
-            # For transfers to phone numbers
-            (r'to\s+([A-Za-z\s]+)\s*\((\d+)\)', 'phone'),
-            # For incoming money
-            (r'from\s+([A-Za-z\s]+)\s*\(\*+(\d+)\)', 'from'),
-            # For agent transactions
-            (r'agent\s+([A-Za-z\s]+)\s*\((\d+)\)', 'agent'),
-            # Generic recipient patterns
-            (r'recipient\s+([A-Za-z\s]+)\s*\((\d+)\)', 'recipient')
-        ]
-        
-        for pattern, transaction_type in recipient_patterns:
+        for pattern in FIELD_PATTERNS['recipient']:
             match = re.search(pattern, body, re.IGNORECASE)
             if match:
                 name = match.group(1).strip()
@@ -177,13 +634,7 @@ class SMSParser:
     
     def extract_sender_info(self, body):
         """Extract sender information for incoming transactions"""
-        sender_patterns = [
-            r'from\s+([A-Za-z\s]+)\s*\(\*+(\d+)\)',
-            r'sender\s+([A-Za-z\s]+)\s*\((\d+)\)',
-            r'initiated by\s+([A-Za-z\s]+)\s*\((\d+)\)'
-        ]
-        
-        for pattern in sender_patterns:
+        for pattern in FIELD_PATTERNS['sender']:
             match = re.search(pattern, body, re.IGNORECASE)
             if match:
                 name = match.group(1).strip()
@@ -194,132 +645,686 @@ class SMSParser:
     
     def extract_message_content(self, body):
         """Extract message/memo content if present"""
-        message_patterns = [
-            r'message[:\s]+"([^"]+)"',
-            r'memo[:\s]+"([^"]+)"',
-            r'note[:\s]+"([^"]+)"'
-        ]
-        
-        for pattern in message_patterns:
+        for pattern in FIELD_PATTERNS['message']:
             match = re.search(pattern, body, re.IGNORECASE)
             if match:
                 return match.group(1).strip()
         
         return None
     
-    def parse_xml_file(self, file_path):
-        """Parse the XML file and extract SMS data"""
-        transactions = []
+    def extract_fields(self, body):
+        """Extract every transaction field from a message in a single pass.
+
+        Equivalent to calling the individual ``extract_*`` methods. The body is
+        lowercased once and each pattern's leading keyword is looked up in it:
+        patterns whose keyword is absent can not match and are skipped, and
+        the rest start searching at the keyword instead of the beginning.
+        """
+        # Keyword lookup only agrees with re.IGNORECASE for ASCII text
+        body_lower = body.lower() if body.isascii() else None
+        
+        fields = {}
+        for field, compiled_patterns in self.field_extractor.items():
+            groups = None
+            if self.profiler is not None:
+                groups = self._search_field_profiled(field, compiled_patterns, body, body_lower)
+            else:
+                for regex, keyword in compiled_patterns:
+                    if keyword is None or body_lower is None:
+                        match = regex.search(body)
+                    else:
+                        position = body_lower.find(keyword)
+                        if position < 0:
+                            continue
+                        match = regex.search(body, position)
+                    
+                    if match:
+                        groups = match.groups()
+                        break
+            
+            if field == 'amount':
+                fields['amount'] = float(groups[0].replace(',', '')) if groups else 0.0
+            elif field == 'balance':
+                fields['balance'] = float(groups[0].replace(',', '')) if groups else None
+            elif field == 'fee':
+                fields['fee'] = float(groups[0]) if groups else 0.0
+            elif field in ('recipient', 'sender'):
+                name, number = (groups[0].strip(), groups[1]) if groups else (None, None)
+                fields[f'{field}_name'] = name
+                fields[f'{field}_number'] = number
+            elif field == 'message':
+                fields['message'] = groups[0].strip() if groups else None
+            else:
+                fields[field] = groups[0] if groups else None
+        
+        return fields
+    
+    def _search_field_profiled(self, field, compiled_patterns, body, body_lower):
+        """Keyword-gated field search that records every pattern attempt"""
+        for index, (regex, keyword) in enumerate(compiled_patterns):
+            key = f'{field}[{index}]'
+            position = 0
+            if keyword is not None and body_lower is not None:
+                position = body_lower.find(keyword)
+                if position < 0:
+                    self.profiler.skip(key, regex.pattern)
+                    continue
+            
+            start = perf_counter()
+            match = regex.search(body, position)
+            self.profiler.record(key, regex.pattern, match is not None, perf_counter() - start)
+            if match:
+                return match.groups()
+        return None
+    
+    def match_template(self, body):
+        """Parse a body with its known message template, if any.
+
+        Returns ``(category, fields)`` when the body's prefix selects a
+        template and the template's anchored pattern matches, otherwise None.
+        """
+        prefix = self.template_prefix_matcher.match(body)
+        if not prefix:
+            return None
+        
+        name = prefix.lastgroup
+        if self.profiler is not None:
+            start = perf_counter()
+            match = self.template_patterns[name].match(body)
+            self.profiler.record(f'template.{name}', self.templates[name]['pattern'], match is not None,
+                                 perf_counter() - start, categorizing=True)
+        else:
+            match = self.template_patterns[name].match(body)
+        if not match or self._guarded_text(name, match):
+            return None
+        
+        template = self.templates[name]
+        fields = {
+            'amount': 0.0,
+            'fee': 0.0,
+            'balance': None,
+            'transaction_id': None,
+            'recipient_name': None,
+            'recipient_number': None,
+            'sender_name': None,
+            'sender_number': None,
+            'message': None
+        }
+        for field, value in match.groupdict().items():
+            if field == 'free_text':
+                continue
+            if field in ('amount', 'fee', 'balance'):
+                value = float(value.replace(',', ''))
+            elif field.endswith('_name'):
+                value = value.strip()
+            fields[field] = value
+        
+        for field, source in template.get('aliases', {}).items():
+            fields[field] = fields[source]
+        
+        self.template_hits[name] += 1
+        return template['category'], fields
+    
+    def _guarded_text(self, name, match):
+        """Whether a name or free text of a template match contains text its guard rejects, or non-ASCII text"""
+        guard, reach, segments = self.template_guards[name]
+        body = match.string
+        for segment in segments:
+            start, end = match.span(segment)
+            if start < end:
+                # Rejected text starts inside the segment but may run on into the fixed text after it;
+                # the guard is lowercase, which only agrees with re.IGNORECASE for ASCII text
+                text = body[start:end + reach]
+                if not text.isascii():
+                    return True
+                found = guard.search(text.lower())
+                if found is not None and found.start() < end - start:
+                    return True
+        return False
+    
+    def template_stats(self):
+        """Return per-template hit counts plus the number of fallback parses"""
+        stats = dict(self.template_hits)
+        stats.setdefault('fallback', 0)
+        return stats
+    
+    def pattern_stats(self):
+        """Return the pattern profile of the parses so far, or None when not profiling"""
+        if self.profiler is None:
+            return None
+        return self.profiler.to_dict()
+    
+    def extract_transaction(self, body, date):
+        """Build the TransactionRecord stored for a single MoMo SMS"""
+        if self.body_cache is not None:
+            key = self.body_cache.key(body)
+            values = self.body_cache.get(key)
+            if values is not None:
+                # Seen this body before: reuse its fields without running any pattern
+                return TransactionRecord(body, date, *values)
+        
+        templated = self.match_template(body)
+        if templated:
+            category, fields = templated
+        else:
+            # Unknown format: run the generic category/extractor cascade
+            self.template_hits['fallback'] += 1
+            category = self.categorize_transaction(body)
+            fields = self.extract_fields(body)
+        
+        # The body is stored once and doubles as the raw body for debugging
+        transaction = TransactionRecord(body, date, category, **fields)
+        if self.body_cache is not None:
+            self.body_cache.put(key, transaction.parsed_values())
+        
+        if self.profiler is not None:
+            self.profiler.end_message()
+        
+        return transaction
+    
+    def iter_sms_elements(self, file_path):
+        """Stream <sms> elements from an SMS backup without loading the whole tree.
+
+        The root element is yielded first so callers can read its attributes
+        (e.g. ``count``). Each ``<sms>`` element is cleared, along with any
+        earlier siblings, once the caller moves on to the next one, which
+        keeps memory flat regardless of file size.
+        """
+        root = None
+        with open_backup(file_path) as f:
+            for event, elem in etree.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                        yield root
+                    continue
+                
+                if elem.tag != 'sms':
+                    continue
+                
+                yield elem
+                
+                # Free the element and everything parsed before it
+                elem.clear(keep_tail=True)
+                parent = elem.getparent()
+                if parent is not None:
+                    while elem.getprevious() is not None:
+                        del parent[0]
+    
+    def iter_prefiltered_elements(self, file_path):
+        """Stream MoMo <sms> elements, skipping other senders before XML decoding.
+
+        Works like iter_sms_elements, but searches the raw bytes for
+        ``address`` attributes naming a MoMo sender and only decodes those
+        records and the first one. The records in between are counted, not
+        parsed, and yielded as their number (an int) so callers can still
+        count them. A backup whose declared encoding is not UTF-8 is read
+        with iter_sms_elements instead. Like iterparse, a backup that ends
+        before its root element is closed raises XMLSyntaxError.
+        """
+        with open_backup(file_path) as f:
+            buffer = b''
+            root_match = None
+            while root_match is None:
+                chunk = f.read(PREFILTER_CHUNK_SIZE)
+                buffer += chunk
+                root_match = self._match_root(buffer)
+                if root_match is None and not chunk:
+                    raise etree.XMLSyntaxError("Start tag expected, '<' not found", None, 0, 0)
+            
+            if self._prefilter_encoding(buffer, root_match.start()):
+                yield from self._iter_prefiltered_records(f, buffer, root_match)
+                return
+        
+        yield from self.iter_sms_elements(file_path)
+    
+    @staticmethod
+    def _match_root(buffer):
+        """Match the root start tag past any BOM, XML declaration, comments and processing instructions
+
+        Returns None while the buffer does not hold the whole root tag yet.
+        """
+        position = len(codecs.BOM_UTF8) if buffer.startswith(codecs.BOM_UTF8) else 0
+        item = _PROLOG_ITEM.match(buffer, position)
+        while item:
+            position = item.end()
+            item = _PROLOG_ITEM.match(buffer, position)
+        return _ROOT_TAG.match(buffer, position)
+    
+    @staticmethod
+    def _prefilter_encoding(buffer, prolog_end):
+        """Whether the backup's raw bytes can be scanned as UTF-8"""
+        if buffer.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return False
+        declaration = _XML_ENCODING.search(buffer, 0, prolog_end)
+        return declaration is None or declaration.group(2).decode('ascii', 'replace').lower() in PREFILTER_ENCODINGS
+    
+    def _iter_prefiltered_records(self, f, buffer, root_match):
+        """Yield the root element, then MoMo records and counts of skipped ones, from the raw bytes"""
+        root_tag = root_match.group(0).strip()
+        closed = root_tag.endswith(b'/>')
+        if not closed:
+            root_tag += b'</' + root_match.group(1) + b'>'
+        yield etree.fromstring(root_tag)
+        
+        closing_tag = re.compile(rb'</' + re.escape(root_match.group(1)) + rb'\s*>')
+        buffer = buffer[root_match.end():]
+        first_record = True
+        at_end = False
+        while True:
+            position = 0
+            search = 0
+            partial = -1
+            while True:
+                # The first record is always decoded so its structure can be validated
+                if first_record:
+                    start = position
+                else:
+                    hit = self.momo_address_attr.search(buffer, search)
+                    if hit is None:
+                        break
+                    search = hit.end()
+                    start = buffer.rfind(b'<sms', position, hit.start())
+                    if start < 0 or buffer[hit.start() - 1:hit.start()] not in (b' ', b'\t', b'\n', b'\r'):
+                        continue
+                
+                start, end = self._find_sms_record(buffer, start)
+                if end < 0:
+                    partial = start
+                    break
+                if closed:
+                    raise etree.XMLSyntaxError("Extra content at the end of the document", None, 0, 0)
+                
+                skipped = len(_SMS_START.findall(buffer, position, start))
+                if skipped:
+                    yield skipped
+                # iter_transactions checks the decoded address, so a false candidate is only skipped later
+                first_record = False
+                yield etree.fromstring(buffer[start:end])
+                position = search = end
+            
+            if partial < 0:
+                # Records after the last MoMo one; the last may be cut off by the chunk boundary
+                partial = buffer.rfind(b'<sms', position)
+                if partial >= 0 and at_end:
+                    partial, end = self._find_sms_record(buffer, partial)
+                    if end >= 0:
+                        partial = -1
+            
+            rest_end = partial if partial >= 0 else len(buffer)
+            skipped = len(_SMS_START.findall(buffer, position, rest_end))
+            if skipped:
+                if closed:
+                    raise etree.XMLSyntaxError("Extra content at the end of the document", None, 0, 0)
+                yield skipped
+            
+            closing = closing_tag.search(buffer, position, rest_end)
+            if closing is not None:
+                if closed or _SMS_START.search(buffer, closing.end(), rest_end) or partial >= 0:
+                    raise etree.XMLSyntaxError("Extra content at the end of the document", None, 0, 0)
+                closed = True
+            
+            if at_end:
+                if partial >= 0:
+                    raise etree.XMLSyntaxError("Unterminated <sms> record at end of file", None, 0, 0)
+                if not closed:
+                    raise etree.XMLSyntaxError(
+                        f"Premature end of data in tag {root_match.group(1).decode('utf-8', 'replace')}", None, 0, 0
+                    )
+                break
+            
+            if partial < 0:
+                # Keep a closing tag cut off by the chunk boundary
+                partial = buffer.rfind(b'<', position)
+                if partial < 0 or b'>' in buffer[partial:]:
+                    partial = len(buffer)
+            chunk = f.read(PREFILTER_CHUNK_SIZE)
+            at_end = not chunk
+            buffer = buffer[partial:] + chunk
+    
+    @staticmethod
+    def _find_sms_record(buffer, position):
+        """Locate the next complete <sms> record in ``buffer``.
+
+        Returns ``(start, end)`` byte offsets. ``end`` is -1 when the record
+        starting at ``start`` is incomplete, and both are -1 when no further
+        record starts in the buffer.
+        """
+        start = buffer.find(b'<sms', position)
+        while start >= 0 and buffer[start + 4:start + 5] not in (b' ', b'\t', b'\n', b'\r', b'/', b'>'):
+            if start + 5 > len(buffer):
+                return start, -1
+            start = buffer.find(b'<sms', start + 4)
+        if start < 0:
+            return -1, -1
+        
+        # The tag ends at the first '>' outside a single or double quoted attribute value
+        tag = _SMS_TAG_REST.match(buffer, start + 4)
+        if tag is None:
+            return start, -1
+        end = tag.end() - 1
+        
+        if buffer[end - 1:end] == b'/':
+            return start, end + 1
+        
+        close = buffer.find(b'</sms>', end)
+        if close < 0:
+            return start, -1
+        return start, close + len(b'</sms>')
+    
+    def parse_record(self, record):
+        """Parse a raw ``(address, date, body)`` SMS record into a TransactionRecord"""
+        address, date_value, body = record
+        return self.extract_transaction(body, self._record_date(date_value))
+    
+    @staticmethod
+    def _record_date(date_value):
+        """Convert an SMS ``date`` attribute (milliseconds) to a datetime"""
+        date_ms = int(date_value)
+        try:
+            return datetime.fromtimestamp(date_ms / 1000)
+        except (ValueError, OSError):
+            # Handle invalid timestamps
+            return datetime.now()
+    
+    def _cached_record(self, record):
+        """Return the TransactionRecord for a raw record from the body cache, or None"""
+        address, date_value, body = record
+        values = self.body_cache.get(self.body_cache.key(body))
+        if values is None:
+            return None
+        return TransactionRecord(body, self._record_date(date_value), *values)
+    
+    def parse_xml_file(self, file_path, **kwargs):
+        """Parse the XML file and extract SMS data
+        
+        Returns ``(transactions, sms_count)``. Takes the same options as
+        iter_transactions, which streams the transactions instead.
+        """
+        transactions = list(self.iter_transactions(file_path, **kwargs))
+        return transactions, self.sms_count
+    
+    def iter_transactions(self, file_path, workers=None, batch_size=PARALLEL_BATCH_SIZE, validate=True, since=None):
+        """Stream the MoMo transactions of a plain or compressed backup in file order, past the ``since`` mark"""
+        ready = []
+        pool = None
+        self.max_sms_date = since or 0
+        self.sms_count = 0
         
         try:
             # Validate file exists
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"XML file not found: {file_path}")
             
-            # Parse XML
-            tree = etree.parse(file_path)
-            root = tree.getroot()
+            # Pool startup costs more than it saves on small files
+            if workers is None:
+                if backup_size(file_path) >= PARALLEL_MIN_FILE_SIZE:
+                    workers = os.cpu_count() or 1
+                else:
+                    workers = 1
+            if workers > 1:
+                print(f"Parsing in parallel with {workers} workers, {batch_size} messages per batch...")
+                pool = parser_pool(workers)
+            
+            # Stream the XML instead of building the full tree
+            if self.prefilter:
+                elements = self.iter_prefiltered_elements(file_path)
+            else:
+                elements = self.iter_sms_elements(file_path)
+            root = next(elements, None)
+            if root is None:
+                raise ValueError("Invalid XML file format: document is empty")
+            
+            # The validate_xml_structure checks run on the root and the first <sms> as they stream by
+            if validate:
+                self._raise_for_error(self._root_error(root))
             
             # Get total SMS count
-            sms_count = int(root.get('count', 0))
+            sms_count = self.sms_count = int(root.get('count', 0))
             print(f"Processing {sms_count} SMS messages...")
             
-            # Find all SMS elements
-            sms_elements = root.xpath('//sms')
-            
             processed_count = 0
             momo_count = 0
+            skipped_count = 0
+            batch = []
+            pending = deque()
             
-            for sms in sms_elements:
+            for sms in elements:
                 processed_count += 1
                 
-                # Only process M-Money messages
-                address = sms.get('address', '')
-                if address.lower() not in ['m-money', 'mtn mobile money', 'momo']:
+                # Records rejected by the pre-filter arrive as a count, without being decoded
+                if isinstance(sms, int):
+                    processed_count += sms - 1
                     continue
                 
-                momo_count += 1
-                body = sms.get('body', '')
-                date_ms = int(sms.get('date', 0))
-                
-                # Convert timestamp (milliseconds) to datetime
-                try:
-                    date = datetime.fromtimestamp(date_ms / 1000)
-                except (ValueError, OSError):
-                    # Handle invalid timestamps
-                    date = datetime.now()
-                
-                # Extract transaction data
-                transaction = {
-                    'body': body,
-                    'date': date,
-                    'category': self.categorize_transaction(body),
-                    'amount': self.extract_amount(body),
-                    'fee': self.extract_fee(body),
-                    'balance': self.extract_balance(body),
-                    'transaction_id': self.extract_transaction_id(body)
-                }
+                if validate and processed_count == 1:
+                    self._raise_for_error(self._sms_error(sms))
                 
-                # Extract recipient/sender information
-                recipient_name, recipient_number = self.extract_recipient_info(body)
-                sender_name, sender_number = self.extract_sender_info(body)
+                # Only process M-Money messages
+                address = sms.get('address', '')
+                if address.lower() not in self.momo_addresses:
+                    continue
                 
-                transaction['recipient_name'] = recipient_name
-                transaction['recipient_number'] = recipient_number
-                transaction['sender_name'] = sender_name
-                transaction['sender_number'] = sender_number
+                date_value = sms.get('date', 0)
+                date_ms = int(date_value)
+                if date_ms > self.max_sms_date:
+                    self.max_sms_date = date_ms
                 
-                # Extract message content
-                transaction['message'] = self.extract_message_content(body)
+                # Skip messages already ingested from an earlier backup
+                if since is not None and date_ms <= since:
+                    skipped_count += 1
+                    continue
                 
-                # Store raw body for debugging
-                transaction['raw_body'] = body
+                momo_count += 1
+                record = (address, date_value, sms.get('body', ''))
                 
-                transactions.append(transaction)
+                if pool is None:
+                    # Extract transaction data
+                    yield self.parse_record(record)
+                else:
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        pending.append(self._submit_batch(pool, batch))
+                        batch = []
+                        # Keep a bounded number of batches in flight, collecting in order
+                        while len(pending) > workers * 2:
+                            self._collect_batch(pending.popleft(), ready)
+                        yield from ready
+                        ready.clear()
                 
                 # Progress update for large files
                 if processed_count % 100 == 0:
                     print(f"Processed {processed_count}/{sms_count} messages, found {momo_count} MoMo transactions...")
             
-            print(f"Parsing complete! Found {momo_count} MoMo transactions out of {processed_count} total SMS messages.")
+            if validate and processed_count == 0:
+                self._raise_for_error("No SMS messages found in file")
+            
+            if pool is not None:
+                if batch:
+                    pending.append(self._submit_batch(pool, batch))
+                while pending:
+                    self._collect_batch(pending.popleft(), ready)
+                    yield from ready
+                    ready.clear()
             
-            return transactions, sms_count
+            print(f"Parsing complete! Found {momo_count} MoMo transactions out of {processed_count} total SMS messages.")
+            if since is not None:
+                print(f"Skipped {skipped_count} MoMo transactions at or before the high-water mark {since}.")
+            print(f"Template hits: {self.template_stats()}")
+            if self.body_cache is not None:
+                print(f"Body cache: {self.body_cache.stats()}")
+            if self.profiler is not None:
+                attempts = self.profiler.to_dict()['attempts_before_match']
+                print(f"Category patterns tried before a match: {attempts}")
             
+        except XMLValidationError as e:
+            print(f"XML validation failed: {e}")
+            raise
         except etree.XMLSyntaxError as e:
             print(f"XML parsing error: {e}")
+            if validate:
+                raise XMLValidationError(f"XML validation error: {e}")
             raise ValueError(f"Invalid XML file format: {e}")
+        except DECOMPRESSION_ERRORS as e:
+            print(f"Decompression error: {e}")
+            raise ValueError(f"Invalid compressed backup: {e}")
         except Exception as e:
             print(f"Error parsing XML: {e}")
             raise
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if self.body_cache is not None:
+                self.body_cache.flush()
+    
+    def iter_transactions_cached(self, file_path, cache, content_hash, max_cached=PARSE_CACHE_MAX_RECORDS, **kwargs):
+        """Stream transactions through a content-addressed ParseCache
+        
+        Cached transactions are yielded without parsing. Otherwise the file
+        is streamed with iter_transactions and stored once fully read, unless
+        it has more than ``max_cached`` transactions, in which case it is not
+        cached so memory stays bounded.
+        """
+        parser_key = self.cache_key()
+        cached = cache.get(content_hash, parser_key)
+        if cached is not None:
+            transactions, self.sms_count, self.max_sms_date = cached
+            print(f"Parse cache hit for {os.path.basename(file_path)}: {len(transactions)} transactions")
+            yield from transactions
+            return
+        
+        collected = []
+        for transaction in self.iter_transactions(file_path, **kwargs):
+            if collected is not None:
+                collected.append(transaction)
+                if max_cached is not None and len(collected) > max_cached:
+                    collected = None
+            yield transaction
+        
+        if collected is not None:
+            cache.put(content_hash, collected, self.sms_count, parser_key, self.max_sms_date)
+    
+    def cache_key(self):
+        """Identify the parser settings and patterns that affect parse results
+        
+        Includes PATTERN_FINGERPRINT, so cached parses are ignored as soon as
+        CATEGORIES, FIELD_PATTERNS or MESSAGE_TEMPLATES change.
+        """
+        return tuple(sorted(self.momo_addresses)), PATTERN_FINGERPRINT, self.prefilter
+    
+    def _submit_batch(self, pool, batch):
+        """Send a batch to a worker, keeping back records found in the body cache
+        
+        Returns ``(future, slots)``: ``slots`` holds the cached record, or None
+        for records the worker parses, in batch order. Without a body cache
+        ``slots`` is None and the worker parses the whole batch.
+        """
+        if self.body_cache is None:
+            return pool.submit(_parse_batch, batch, self.profile), None
+        
+        slots = [self._cached_record(record) for record in batch]
+        misses = [record for record, slot in zip(batch, slots) if slot is None]
+        future = pool.submit(_parse_batch, misses, self.profile) if misses else None
+        return future, slots
+    
+    def _collect_batch(self, submitted, transactions):
+        """Append a finished worker batch to ``transactions`` and merge its stats"""
+        future, slots = submitted
+        batch_transactions = []
+        if future is not None:
+            batch_transactions, template_hits, pattern_stats = future.result()
+            self.template_hits.update(template_hits)
+            if pattern_stats is not None:
+                self.profiler.merge(pattern_stats)
+        
+        if slots is None:
+            transactions.extend(batch_transactions)
+            return
+        
+        # Merge worker results back between the cached records, memoising them
+        parsed = iter(batch_transactions)
+        for transaction in slots:
+            if transaction is None:
+                transaction = next(parsed)
+                self.body_cache.put(self.body_cache.key(transaction.body), transaction.parsed_values())
+            transactions.append(transaction)
     
     def validate_xml_structure(self, file_path):
-        """Validate XML file structure before processing"""
+        """Validate XML file structure before processing
+        
+        Only the root element and the first <sms> are read. parse_xml_file
+        runs the same checks while parsing, so calling this first is only
+        needed when the file should not be parsed yet.
+        """
+        elements = None
         try:
-            tree = etree.parse(file_path)
-            root = tree.getroot()
+            elements = self.iter_sms_elements(file_path)
+            root = next(elements)
             
-            # Check if it's an SMS backup format
-            if root.tag != 'smses':
-                return False, "Not a valid SMS backup XML file"
-            
-            # Check for required attributes
-            if 'count' not in root.attrib:
-                return False, "Missing count attribute in root element"
+            # Check if it's an SMS backup format and has the required attributes
+            error = self._root_error(root)
+            if error:
+                return False, error
             
             # Check for SMS elements
-            sms_elements = root.xpath('//sms')
-            if not sms_elements:
+            sample_sms = next(elements, None)
+            if sample_sms is None:
                 return False, "No SMS messages found in file"
             
             # Check SMS element structure
-            sample_sms = sms_elements[0]
-            required_attrs = ['address', 'date', 'body']
-            missing_attrs = [attr for attr in required_attrs if attr not in sample_sms.attrib]
-            
-            if missing_attrs:
-                return False, f"SMS elements missing required attributes: {missing_attrs}"
+            error = self._sms_error(sample_sms)
+            if error:
+                return False, error
             
             return True, "Valid SMS backup XML file"
             
         except Exception as e:
-            return False, f"XML validation error: {e}"
\ No newline at end of file
+            return False, f"XML validation error: {e}"
+        finally:
+            if elements is not None:
+                elements.close()
+    
+    @staticmethod
+    def _root_error(root):
+        """Return the validation error for an SMS backup root element, if any"""
+        if root.tag != 'smses':
+            return "Not a valid SMS backup XML file"
+        
+        if 'count' not in root.attrib:
+            return "Missing count attribute in root element"
+        
+        return None
+    
+    @staticmethod
+    def _sms_error(sms):
+        """Return the validation error for a sample <sms> element, if any"""
+        required_attrs = ['address', 'date', 'body']
+        missing_attrs = [attr for attr in required_attrs if attr not in sms.attrib]
+        
+        if missing_attrs:
+            return f"SMS elements missing required attributes: {missing_attrs}"
+        
+        return None
+    
+    @staticmethod
+    def _raise_for_error(error):
+        """Raise an XMLValidationError for a non-empty validation error"""
+        if error:
+            raise XMLValidationError(error)
+
+
+# Parsers used by each worker process of a parallel parse, created on first use
+_worker_parsers = {}
+
+
+def _parse_batch(records, profile=False):
+    """Parse a batch of raw SMS records in a worker process"""
+    parser = _worker_parsers.get(profile)
+    if parser is None:
+        parser = _worker_parsers[profile] = SMSParser(profile=profile)
+    
+    parser.template_hits.clear()
+    if parser.profiler is not None:
+        parser.profiler.reset()
+    transactions = [parser.parse_record(record) for record in records]
+    return transactions, dict(parser.template_hits), parser.pattern_stats()
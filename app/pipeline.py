@@ -0,0 +1,288 @@
+"""
+Ingest pipeline for MoMo Analytics
+Overlaps parsing with database writes by feeding a writer thread through a
+bounded queue, and ingests batches of backups as one de-duplicated set
+"""
+
+import hashlib
+import os
+import queue
+import threading
+import uuid
+from collections import deque
+from itertools import islice, repeat
+from flask import current_app
+from . import db
+from .database import DatabaseService, DEFAULT_SOURCE, merge_key
+from .parser import SMSParser, parser_pool
+from .cache import ParseCache
+from .sqlite_profiles import bulk_ingest_profile
+
+# Transactions handed to the writer thread at a time
+INGEST_BATCH_SIZE = 1000
+# Batches that may wait for the writer before the parser is held back
+INGEST_QUEUE_SIZE = 4
+
+# Queue markers for the end of the stream and an aborted parse
+_END = object()
+_ABORT = object()
+
+
+def run_ingest_pipeline(transactions, replace=False, batch_size=INGEST_BATCH_SIZE, queue_size=INGEST_QUEUE_SIZE,
+                        commit_every=None, upload_id=None, skip=0, merge=False):
+    """Insert transactions on a writer thread while the iterable produces them; returns the number inserted"""
+    app = current_app._get_current_object()
+    # A full queue holds back the parser, so a slow database keeps memory bounded
+    batches = queue.Queue(maxsize=queue_size)
+    state = {'written': 0, 'committed': 0, 'known': 0, 'error': None}
+    
+    def commit_chunk():
+        if upload_id is not None:
+            # The checkpoint is committed together with the rows it counts
+            DatabaseService.update_upload_record(upload_id, processed_messages=skip + state['written'])
+        else:
+            db.session.commit()
+        DatabaseService.bump_data_generation()
+        state['committed'] = state['written']
+    
+    def writer():
+        with app.app_context(), bulk_ingest_profile(db.engine):
+            item = None
+            try:
+                cleared = not replace
+                while True:
+                    item = batches.get()
+                    if item is _END:
+                        break
+                    if item is _ABORT:
+                        db.session.rollback()
+                        return
+                    
+                    # Replacing waits for the first batch, so a file without MoMo transactions keeps the data
+                    if not cleared:
+                        DatabaseService.clear_transactions(commit=False)
+                        cleared = True
+                    state['written'] += DatabaseService.add_multiple_transactions(item, commit=False, merge=merge)
+                    print(f"💾 Wrote {state['written']} transactions...")
+                    
+                    # Chunked commits show up on the dashboard while the rest loads
+                    if commit_every and state['written'] - state['committed'] >= commit_every:
+                        commit_chunk()
+                        print(f"📌 Committed {skip + state['written']} transactions")
+                
+                commit_chunk()
+            
+            except Exception as e:
+                db.session.rollback()
+                state['error'] = e
+                if commit_every and state['committed']:
+                    print(f"📌 {skip + state['committed']} transactions were committed before the failure")
+                # Keep draining so the parser never blocks on a full queue
+                while item is not _END and item is not _ABORT:
+                    item = batches.get()
+            finally:
+                db.session.remove()
+    
+    thread = threading.Thread(target=writer, name='ingest-writer', daemon=True)
+    thread.start()
+    
+    try:
+        batch = []
+        # Transactions up to the checkpoint of an interrupted run are already stored
+        stream = islice(transactions, skip, None)
+        if merge:
+            stream = _unknown_transactions(stream, DatabaseService.get_merge_keys(), state)
+        for transaction in stream:
+            batch.append(transaction)
+            if len(batch) >= batch_size:
+                if state['error'] is not None:
+                    break
+                batches.put(batch)
+                batch = []
+        
+        if batch and state['error'] is None:
+            batches.put(batch)
+        batches.put(_END)
+    except BaseException:
+        batches.put(_ABORT)
+        thread.join()
+        raise
+    finally:
+        # Stop a parse abandoned because the writer failed
+        close = getattr(transactions, 'close', None)
+        if close is not None:
+            close()
+    
+    thread.join()
+    if state['error'] is not None:
+        raise state['error']
+    
+    if merge:
+        print(f"⏭️ Skipped {state['known']} transactions that were already stored")
+    return state['written']
+
+
+def _unknown_transactions(transactions, known_keys, state):
+    """Drop transactions whose merge key (as an integer) is in ``known_keys``, adding the rest to it"""
+    for transaction in transactions:
+        key = int(merge_key(transaction.transaction_id, transaction.date, transaction.amount, transaction.body), 16)
+        if key in known_keys:
+            state['known'] += 1
+            continue
+        known_keys.add(key)
+        yield transaction
+
+
+def transaction_fingerprint(transaction):
+    """Identify a transaction by its SMS timestamp and body"""
+    key = f'{transaction.date.isoformat()}|{transaction.body}'
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+def _parse_backup_file(file_path, content_hash, cache_max_bytes):
+    """Parse one backup of a batch, in a worker process when run in parallel
+
+    Goes through the parse cache like a single-file ingest, so backups with
+    more than PARSE_CACHE_MAX_RECORDS transactions are not cached.
+    """
+    parser = SMSParser()
+    try:
+        transactions = list(parser.iter_transactions_cached(
+            file_path, ParseCache(max_bytes=cache_max_bytes), content_hash, workers=1
+        ))
+    except (ValueError, OSError) as e:
+        return {'error': str(e)}
+    
+    return {'transactions': transactions, 'sms_count': parser.sms_count, 'max_sms_date': parser.max_sms_date}
+
+
+def _parse_ahead(pool, arguments, window):
+    """Parse backups in the pool, yielding results in order with at most ``window`` files in flight
+
+    A file's transactions are only returned to this process while it is
+    merged or at most ``window`` files ahead of it, so memory is bounded by a
+    few backups rather than the whole batch.
+    """
+    pending = deque()
+    for file_arguments in zip(*arguments):
+        pending.append(pool.submit(_parse_backup_file, *file_arguments))
+        if len(pending) > window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def ingest_files(file_paths, workers=None, replace=True):
+    """Parse several backups in parallel and ingest them as one de-duplicated set
+
+    Files are parsed by up to ``workers`` processes (one file each), at most
+    ``workers`` files ahead of the one being merged, and merged in the given
+    order. A transaction is dropped as a duplicate when
+    an earlier file already had its transaction id or the same SMS body at
+    the same timestamp; duplicates within a single file are kept, as in a
+    single-file ingest. Every file gets an UploadHistory record sharing one
+    ``batch_id`` with its own message, inserted and duplicate counts. Files
+    that fail to parse are marked failed and skipped.
+
+    With ``replace`` the merged set replaces the stored transactions.
+    Returns a summary with the per-file breakdown.
+    """
+    batch_id = uuid.uuid4().hex
+    files = []
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
+        content_hash = ParseCache.hash_file(file_path)
+        files.append({
+            'filename': filename,
+            'path': file_path,
+            'content_hash': content_hash,
+            'upload_id': DatabaseService.add_upload_record(filename, status='processing', content_hash=content_hash,
+                                                           batch_id=batch_id),
+            'total_messages': 0,
+            'processed_messages': 0,
+            'duplicate_messages': 0,
+            'status': 'processing',
+            'error': None
+        })
+    
+    if workers is None:
+        workers = min(len(files), os.cpu_count() or 1)
+    print(f"📚 Batch {batch_id}: ingesting {len(files)} file(s) with {workers} worker(s)...")
+    
+    arguments = (
+        [file_info['path'] for file_info in files],
+        [file_info['content_hash'] for file_info in files],
+        repeat(current_app.config['PARSE_CACHE_MAX_BYTES'])
+    )
+    pool = parser_pool(workers) if workers > 1 and len(files) > 1 else None
+    state = {'max_sms_date': 0}
+    
+    def merged_transactions(results):
+        seen_ids = set()
+        seen_fingerprints = set()
+        for file_info, result in zip(files, results):
+            if 'error' in result:
+                print(f"❌ {file_info['filename']}: {result['error']}")
+                file_info['status'] = 'failed'
+                file_info['error'] = result['error']
+                continue
+            
+            # Only earlier files count as duplicates, so collect this file's keys separately
+            file_ids = set()
+            file_fingerprints = set()
+            for transaction in result['transactions']:
+                fingerprint = transaction_fingerprint(transaction)
+                transaction_id = transaction.transaction_id
+                if fingerprint in seen_fingerprints or (transaction_id and transaction_id in seen_ids):
+                    file_info['duplicate_messages'] += 1
+                    continue
+                
+                file_fingerprints.add(fingerprint)
+                if transaction_id:
+                    file_ids.add(transaction_id)
+                file_info['processed_messages'] += 1
+                yield transaction
+            
+            seen_ids |= file_ids
+            seen_fingerprints |= file_fingerprints
+            file_info['total_messages'] = result['sms_count']
+            file_info['status'] = 'completed'
+            state['max_sms_date'] = max(state['max_sms_date'], result['max_sms_date'])
+            print(f"📄 {file_info['filename']}: {file_info['processed_messages']} new, "
+                  f"{file_info['duplicate_messages']} duplicate transactions")
+    
+    try:
+        results = _parse_ahead(pool, arguments, workers) if pool else map(_parse_backup_file, *arguments)
+        processed = run_ingest_pipeline(merged_transactions(results), replace=replace)
+    except Exception:
+        for file_info in files:
+            DatabaseService.update_upload_record(file_info['upload_id'], status='failed')
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    
+    if processed:
+        DatabaseService.set_watermark(DEFAULT_SOURCE, state['max_sms_date'])
+    
+    for file_info in files:
+        DatabaseService.update_upload_record(file_info['upload_id'],
+            total_messages=file_info['total_messages'],
+            processed_messages=file_info['processed_messages'],
+            duplicate_messages=file_info['duplicate_messages'],
+            status=file_info['status']
+        )
+    
+    duplicates = sum(file_info['duplicate_messages'] for file_info in files)
+    print(f"✅ Batch {batch_id}: {processed} transactions ingested, {duplicates} duplicates skipped")
+    
+    return {
+        'batch_id': batch_id,
+        'processed': processed,
+        'duplicates': duplicates,
+        'files': [
+            {key: file_info[key] for key in ('filename', 'upload_id', 'total_messages', 'processed_messages',
+                                             'duplicate_messages', 'status', 'error')}
+            for file_info in files
+        ]
+    }
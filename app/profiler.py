@@ -0,0 +1,86 @@
+"""
+Pattern profiling for MoMo Analytics
+Counts how often each SMSParser pattern is tried, how often it matches and
+how long it takes, so patterns can be reordered or pruned on measured cost.
+"""
+
+from collections import Counter
+
+
+class PatternProfiler:
+    """Per-pattern attempt/hit/time counters collected during a parse"""
+    
+    def __init__(self):
+        self.patterns = {}
+        self.attempts_before_match = Counter()
+        self.messages = 0
+        self._message_attempts = 0
+    
+    def _entry(self, key, pattern):
+        entry = self.patterns.get(key)
+        if entry is None:
+            entry = self.patterns[key] = {
+                'pattern': pattern,
+                'attempts': 0,
+                'hits': 0,
+                'skipped': 0,
+                'seconds': 0.0
+            }
+        return entry
+    
+    def record(self, key, pattern, hit, seconds, categorizing=False):
+        """Record one attempt of a pattern
+
+        ``categorizing`` marks patterns tried to decide the message category;
+        those count towards the message's attempts-before-match.
+        """
+        entry = self._entry(key, pattern)
+        entry['attempts'] += 1
+        entry['seconds'] += seconds
+        if hit:
+            entry['hits'] += 1
+        if categorizing:
+            self._message_attempts += 1
+    
+    def skip(self, key, pattern):
+        """Record a pattern skipped because its leading keyword is absent"""
+        self._entry(key, pattern)['skipped'] += 1
+    
+    def end_message(self):
+        """Close the current message and add it to the attempts histogram"""
+        self.messages += 1
+        self.attempts_before_match[self._message_attempts] += 1
+        self._message_attempts = 0
+    
+    def merge(self, stats):
+        """Add counters from another profiler's ``to_dict()`` output"""
+        for other in stats['patterns']:
+            entry = self._entry(other['key'], other['pattern'])
+            for counter in ('attempts', 'hits', 'skipped', 'seconds'):
+                entry[counter] += other[counter]
+        
+        for attempts, messages in stats['attempts_before_match'].items():
+            self.attempts_before_match[int(attempts)] += messages
+        self.messages += stats['messages']
+    
+    def reset(self):
+        self.patterns.clear()
+        self.attempts_before_match.clear()
+        self.messages = 0
+        self._message_attempts = 0
+    
+    def to_dict(self):
+        """Return the counters with patterns ordered by cumulative time, costliest first"""
+        patterns = []
+        for key, entry in sorted(self.patterns.items(), key=lambda item: -item[1]['seconds']):
+            patterns.append(dict(entry,
+                key=key,
+                seconds=round(entry['seconds'], 6),
+                hit_rate=round(entry['hits'] / entry['attempts'], 4) if entry['attempts'] else 0.0
+            ))
+        
+        return {
+            'messages': self.messages,
+            'attempts_before_match': {str(attempts): count for attempts, count in sorted(self.attempts_before_match.items())},
+            'patterns': patterns
+        }
@@ -0,0 +1,103 @@
+"""
+Compact transaction records for MoMo Analytics
+Parsed SMS are kept as slotted objects instead of per-message dicts
+"""
+
+
+class TransactionRecord:
+    """A parsed MoMo transaction with fixed fields and the SMS body stored once
+
+    Supports read-only mapping access (``record['amount']``, ``in``,
+    iteration, ``len``, ``get``, ``keys``, ``values``, ``items``,
+    ``dict(record)``) so code written for the old transaction dicts keeps
+    working. ``raw_body`` is an alias of ``body``.
+    """
+    
+    __slots__ = (
+        'body',
+        'date',
+        'category',
+        'amount',
+        'fee',
+        'balance',
+        'transaction_id',
+        'recipient_name',
+        'recipient_number',
+        'sender_name',
+        'sender_number',
+        'message'
+    )
+    
+    FIELDS = __slots__ + ('raw_body',)
+    # Fields derived from the body alone, in constructor order after ``date``
+    PARSED_FIELDS = __slots__[2:]
+    
+    def __init__(self, body, date, category, amount=0.0, fee=0.0, balance=None, transaction_id=None,
+                 recipient_name=None, recipient_number=None, sender_name=None, sender_number=None,
+                 message=None):
+        self.body = body
+        self.date = date
+        self.category = category
+        self.amount = amount
+        self.fee = fee
+        self.balance = balance
+        self.transaction_id = transaction_id
+        self.recipient_name = recipient_name
+        self.recipient_number = recipient_number
+        self.sender_name = sender_name
+        self.sender_number = sender_number
+        self.message = message
+    
+    @property
+    def raw_body(self):
+        return self.body
+    
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def get(self, key, default=None):
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key)
+    
+    def __contains__(self, key):
+        return key in self.FIELDS
+    
+    def __iter__(self):
+        return iter(self.FIELDS)
+    
+    def __len__(self):
+        return len(self.FIELDS)
+    
+    def keys(self):
+        return self.FIELDS
+    
+    def values(self):
+        return [getattr(self, key) for key in self.FIELDS]
+    
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.FIELDS]
+    
+    def parsed_values(self):
+        """Return the PARSED_FIELDS values, e.g. for memoising a body's parse"""
+        return tuple(getattr(self, key) for key in self.PARSED_FIELDS)
+    
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.FIELDS}
+    
+    def __getstate__(self):
+        return tuple(getattr(self, key) for key in self.__slots__)
+    
+    def __setstate__(self, state):
+        for key, value in zip(self.__slots__, state):
+            setattr(self, key, value)
+    
+    def __eq__(self, other):
+        if not isinstance(other, TransactionRecord):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+    
+    def __repr__(self):
+        return f'<TransactionRecord {self.transaction_id} {self.category} {self.amount}>'
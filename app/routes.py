@@ -1,19 +1,189 @@
 from flask import Blueprint, render_template, request, jsonify, current_app, Response
 from werkzeug.utils import secure_filename
-from .database import DatabaseService
-from .parser import SMSParser
+from .database import DatabaseService, DEFAULT_SOURCE
+from .parser import SMSParser, XMLValidationError, PATTERN_FINGERPRINT
+from .cache import ParseCache, BodyCache, ResponseCache, DEFAULT_BODY_CACHE_PATH
+from .pipeline import run_ingest_pipeline, ingest_files
 from datetime import datetime
+from functools import wraps
 import os
 import io
 import csv
 
 main = Blueprint('main', __name__)
 
-ALLOWED_EXTENSIONS = {'xml'}
+# Plain and compressed (gzip, bzip2, zip) SMS backups
+ALLOWED_EXTENSIONS = {'xml', 'gz', 'bz2', 'zip'}
+
+# Pattern profile of the most recent profiled parse, served by /api/parser-stats
+last_parser_stats = {}
+
+# Body memo shared by every ingest in this process, created on first use
+body_cache = None
+
+# Read-only API responses of the current data generation, created on first use
+response_cache = None
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_parse_cache():
+    """Parse cache sized from the app configuration"""
+    return ParseCache(max_bytes=current_app.config['PARSE_CACHE_MAX_BYTES'])
+
+def get_body_cache():
+    """Body memo sized from the app configuration"""
+    global body_cache
+    if body_cache is None:
+        body_cache = BodyCache(
+            max_entries=current_app.config['BODY_CACHE_ENTRIES'],
+            db_path=DEFAULT_BODY_CACHE_PATH if current_app.config['BODY_CACHE_PERSIST'] else None,
+            version=PATTERN_FINGERPRINT
+        )
+    return body_cache
+
+def get_response_cache():
+    """Response cache sized from the app configuration"""
+    global response_cache
+    if response_cache is None:
+        response_cache = ResponseCache(max_entries=current_app.config['RESPONSE_CACHE_ENTRIES'])
+    return response_cache
+
+def cached_response(view):
+    """Serve a read-only JSON endpoint from the response cache until the transactions change
+
+    Responses are keyed by endpoint and query arguments. Only successful
+    responses are kept; the DatabaseService read methods raise on database
+    errors, so a failed query is never cached as an empty result.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = get_response_cache()
+        key = (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+        # Read before querying, so a result that races an ingest is filed under the older generation
+        generation = DatabaseService.data_generation()
+        data = cache.get(key, generation)
+        if data is not None:
+            return current_app.response_class(data, mimetype='application/json')
+        
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            cache.put(key, generation, response.get_data())
+        return response
+    return wrapper
+
+def create_parser():
+    """SMS parser, profiling its patterns when PARSER_PROFILE is enabled"""
+    if current_app.config['PARSER_PROFILE']:
+        # Profiling needs every body parsed, so the body cache is bypassed like the parse cache
+        return SMSParser(profile=True)
+    return SMSParser(body_cache=get_body_cache())
+
+def iter_for_ingest(parser, file_path, content_hash, since=None):
+    """Stream a backup's transactions for ingestion, only past the high-water mark when one is given"""
+    if since is not None:
+        print(f"⏩ [WEB] Incremental ingest: skipping messages dated at or before {since}")
+        return profiled_iter(parser, file_path, since=since)
+    
+    if parser.profile:
+        # Profiling needs a real parse, so the parse cache is bypassed
+        return profiled_iter(parser, file_path)
+    
+    return parser.iter_transactions_cached(file_path, get_parse_cache(), content_hash)
+
+def profiled_iter(parser, file_path, **kwargs):
+    """Stream a backup and keep its pattern profile for /api/parser-stats"""
+    yield from parser.iter_transactions(file_path, **kwargs)
+    if parser.profile:
+        last_parser_stats.clear()
+        last_parser_stats.update({
+            'file': os.path.basename(file_path),
+            'parsed_at': datetime.now().isoformat(),
+            'template_hits': parser.template_stats(),
+            **parser.pattern_stats()
+        })
+
+def already_loaded_response(filename, content_hash):
+    """Record and report an ingest skipped because its data is already loaded"""
+    previous = DatabaseService.find_loaded_upload(content_hash)
+    if previous is None:
+        return None
+    
+    print(f"♻️ [WEB] {filename} matches the loaded upload {previous['id']}, skipping parse")
+    DatabaseService.add_upload_record(filename,
+        total_messages=previous['total_messages'],
+        processed_messages=previous['processed_messages'],
+        status='unchanged',
+        content_hash=content_hash
+    )
+    return jsonify({
+        'success': True,
+        'message': f'{filename} is identical to the data already loaded; nothing to process',
+        'total_messages': previous['total_messages'],
+        'processed': 0,
+        'total_in_db': previous['processed_messages']
+    })
+
+def start_upload_record(filename, content_hash, resume=True):
+    """Create the upload record for an ingest, or reopen an interrupted one of the same file
+
+    Returns the record id and how many transactions an interrupted ingest
+    already committed, which the new run skips.
+    """
+    resumable = DatabaseService.find_resumable_upload(content_hash) if resume else None
+    if resumable is None:
+        upload_id = DatabaseService.add_upload_record(filename, status='processing', content_hash=content_hash)
+        print(f"📋 [WEB] Created upload record: {upload_id}")
+        return upload_id, 0
+    
+    DatabaseService.update_upload_record(resumable['id'], status='processing')
+    print(f"⏯️ [WEB] Resuming upload {resumable['id']} after {resumable['processed_messages']} committed transactions")
+    return resumable['id'], resumable['processed_messages']
+
+def ingest_backup(file_path, filename, content_hash, mode, source):
+    """Ingest a backup in 'replace', 'incremental' or 'merge' mode; returns its SMS count and the transactions ingested"""
+    incremental = mode == 'incremental'
+    merge = mode == 'merge'
+    # A merge skips stored rows by itself, so it never resumes and is not checkpointed
+    upload_id, skip = start_upload_record(filename, content_hash, resume=not merge)
+    
+    try:
+        parser = create_parser()
+        since = DatabaseService.get_watermark(source) if incremental or skip else None
+        
+        if skip:
+            # A replace cleared the watermark with its first chunk, so the resumed stream matches the original
+            print("➕ [WEB] Resuming: keeping the transactions committed so far")
+        elif incremental:
+            # Only messages past the high-water mark are parsed, keep existing rows
+            print(f"➕ [WEB] Incremental mode: keeping existing transactions for source '{source}'")
+        elif merge:
+            # Every message is parsed, but only transactions not stored yet are inserted
+            print("🔀 [WEB] Merge mode: keeping existing transactions and adding new ones")
+        else:
+            # REPLACE EXISTING DATA to prevent duplicates. They are deleted with the first chunk, so an ingest
+            # failing after a commit leaves a partial load, which retrying the same file resumes
+            print("🗑️ [WEB] Existing transactions will be replaced to prevent duplicates...")
+        
+        transactions = iter_for_ingest(parser, file_path, content_hash, since)
+        processed = skip + run_ingest_pipeline(transactions, replace=not (incremental or merge or skip),
+                                               commit_every=current_app.config['INGEST_COMMIT_EVERY'],
+                                               upload_id=None if merge else upload_id, skip=skip, merge=merge)
+        
+        if processed:
+            DatabaseService.set_watermark(source, parser.max_sms_date)
+        DatabaseService.update_upload_record(upload_id,
+            total_messages=parser.sms_count,
+            processed_messages=processed,
+            status='completed'
+        )
+        return parser.sms_count, processed
+    
+    except Exception:
+        # Leave no record stuck in 'processing'
+        DatabaseService.update_upload_record(upload_id, status='failed')
+        raise
+
 def format_file_size(size_bytes):
     """Format file size in human readable format"""
     if size_bytes == 0:
@@ -72,11 +242,12 @@ def detect_files():
 def process_detected_file():
     """Process a detected XML file from data directory"""
     print("🔧 [WEB] Starting process_detected_file...")
-    upload_id = None
     
     try:
         data = request.get_json()
         file_path = data.get('file_path')
+        mode = data.get('mode') or 'replace'
+        source = data.get('source') or DEFAULT_SOURCE
         
         if not file_path:
             print("❌ [WEB] No file path provided")
@@ -103,62 +274,35 @@ def process_detected_file():
         initial_count = Transaction.query.count()
         print(f"📊 [WEB] Initial database count: {initial_count}")
         
-        # Create upload history record
+        # Skip byte-identical files whose data is already loaded
         filename = os.path.basename(full_path)
-        upload_id = DatabaseService.add_upload_record(filename, status='processing')
-        print(f"📋 [WEB] Created upload record: {upload_id}")
-        
-        # Parse the XML file
-        parser = SMSParser()
-        
-        # Validate XML structure
-        print("🔍 [WEB] Validating XML structure...")
-        is_valid, validation_message = parser.validate_xml_structure(full_path)
-        if not is_valid:
-            print(f"❌ [WEB] XML validation failed: {validation_message}")
-            if upload_id:
-                DatabaseService.update_upload_record(upload_id, status='failed')
-            return jsonify({'error': f'Invalid XML file: {validation_message}'}), 400
+        content_hash = ParseCache.hash_file(full_path)
+        unchanged = already_loaded_response(filename, content_hash)
+        if unchanged is not None:
+            return unchanged
+        
+        # Parse and save concurrently, validating the XML structure as it streams
+        print("⚙️ [WEB] Validating, parsing and saving XML file...")
+        try:
+            total_count, processed = ingest_backup(full_path, filename, content_hash, mode, source)
+        except XMLValidationError as e:
+            print(f"❌ [WEB] XML validation failed: {e}")
+            return jsonify({'error': f'Invalid XML file: {e}'}), 400
         
         print("✅ [WEB] XML validation passed")
+        print(f"📊 [WEB] Found {processed} MoMo transactions from {total_count} SMS messages")
         
-        # Parse transactions
-        print("⚙️ [WEB] Parsing XML file...")
-        transactions, total_count = parser.parse_xml_file(full_path)
-        print(f"📊 [WEB] Found {len(transactions)} MoMo transactions from {total_count} SMS messages")
-        
-        if not transactions:
+        if not processed:
             print("⚠️ [WEB] No MoMo transactions found")
-            if upload_id:
-                DatabaseService.update_upload_record(upload_id, status='completed', 
-                                                    total_messages=total_count, 
-                                                    processed_messages=0)
             return jsonify({
                 'success': True,
-                'message': 'No MoMo transactions found in XML file',
+                'message': 'No new MoMo transactions since the last ingest' if mode in ('incremental', 'merge') else 'No MoMo transactions found in XML file',
                 'total_messages': total_count,
                 'processed': 0
             })
         
-        # CLEAR EXISTING DATA to prevent duplicates
-        print("🗑️ [WEB] Clearing existing transactions to prevent duplicates...")
-        DatabaseService.clear_transactions()
-        cleared_count = Transaction.query.count()
-        print(f"📊 [WEB] After clearing: {cleared_count} transactions")
-        
-        # Add new transactions
-        print("💾 [WEB] Adding new transactions to database...")
-        processed = DatabaseService.add_multiple_transactions(transactions)
         print(f"✅ [WEB] Successfully added {processed} transactions to database")
         
-        # Update upload history
-        if upload_id:
-            DatabaseService.update_upload_record(upload_id, 
-                total_messages=total_count,
-                processed_messages=processed,
-                status='completed'
-            )
-        
         # Verify final state
         final_count = Transaction.query.count()
         print(f"📊 [WEB] Total transactions in database now: {final_count}")
@@ -173,22 +317,56 @@ def process_detected_file():
         
     except ValueError as e:
         print(f"❌ [WEB] ValueError: {e}")
-        if upload_id:
-            DatabaseService.update_upload_record(upload_id, status='failed')
         return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"❌ [WEB] Exception: {e}")
         import traceback
         traceback.print_exc()
-        if upload_id:
-            DatabaseService.update_upload_record(upload_id, status='failed')
         return jsonify({'error': 'Internal server error while processing file'}), 500
 
+@main.route('/api/process-all-files', methods=['POST'])
+def process_all_files():
+    """Process every detected XML file as one de-duplicated batch"""
+    print("🔧 [WEB] Starting process_all_files...")
+    
+    try:
+        files = DatabaseService.detect_xml_files()
+        if not files:
+            print("❌ [WEB] No XML files found")
+            return jsonify({'error': 'No XML files found in data directory'}), 404
+        
+        data = request.get_json(silent=True) or {}
+        result = ingest_files([file_info['path'] for file_info in files], workers=data.get('workers'))
+        
+        from app.models import Transaction
+        final_count = Transaction.query.count()
+        print(f"📊 [WEB] Total transactions in database now: {final_count}")
+        
+        failed = [file_info for file_info in result['files'] if file_info['status'] == 'failed']
+        if len(failed) == len(files):
+            return jsonify({'error': 'None of the detected files could be processed', 'files': result['files']}), 400
+        
+        return jsonify({
+            'success': True,
+            'message': f"Successfully processed {result['processed']} transactions from {len(files) - len(failed)} files "
+                       f"({result['duplicates']} duplicates skipped)",
+            'batch_id': result['batch_id'],
+            'processed': result['processed'],
+            'duplicates': result['duplicates'],
+            'files': result['files'],
+            'total_in_db': final_count
+        })
+        
+    except Exception as e:
+        print(f"❌ [WEB] Exception: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': 'Internal server error while processing files'}), 500
+
 @main.route('/api/upload', methods=['POST'])
 def upload_file():
     """Upload and process XML file through web interface"""
     print("🔧 [WEB] Starting file upload via web interface...")
-    upload_id = None
     
     try:
         if 'file' not in request.files:
@@ -202,9 +380,11 @@ def upload_file():
         
         if not file or not allowed_file(file.filename):
             print("❌ [WEB] Invalid file type")
-            return jsonify({'error': 'Invalid file type. Please upload an XML file.'}), 400
+            return jsonify({'error': 'Invalid file type. Please upload an XML file (.xml, .gz, .bz2 or .zip).'}), 400
         
         filename = secure_filename(file.filename)
+        mode = request.form.get('mode') or 'replace'
+        source = request.form.get('source') or DEFAULT_SOURCE
         print(f"📁 [WEB] Uploading file: {filename}")
         
         # Check current database state
@@ -220,67 +400,41 @@ def upload_file():
         file.save(filepath)
         print(f"💾 [WEB] File saved to: {filepath}")
         
-        # Create upload history record
-        upload_id = DatabaseService.add_upload_record(filename, status='processing')
-        print(f"📋 [WEB] Created upload record: {upload_id}")
-        
-        # Parse the XML file
-        parser = SMSParser()
-        
-        # Validate XML structure
-        print("🔍 [WEB] Validating uploaded XML...")
-        is_valid, validation_message = parser.validate_xml_structure(filepath)
-        if not is_valid:
-            print(f"❌ [WEB] XML validation failed: {validation_message}")
-            if upload_id:
-                DatabaseService.update_upload_record(upload_id, status='failed')
+        # Skip byte-identical uploads whose data is already loaded
+        content_hash = ParseCache.hash_file(filepath)
+        unchanged = already_loaded_response(filename, content_hash)
+        if unchanged is not None:
+            os.remove(filepath)
+            return unchanged
+        
+        # Parse and save concurrently, validating the XML structure as it streams
+        print("⚙️ [WEB] Validating, parsing and saving uploaded XML...")
+        try:
+            total_count, processed = ingest_backup(filepath, filename, content_hash, mode, source)
+        except XMLValidationError as e:
+            print(f"❌ [WEB] XML validation failed: {e}")
             # Clean up uploaded file
             if os.path.exists(filepath):
                 os.remove(filepath)
-            return jsonify({'error': f'Invalid XML file: {validation_message}'}), 400
+            return jsonify({'error': f'Invalid XML file: {e}'}), 400
         
         print("✅ [WEB] XML validation passed")
+        print(f"📊 [WEB] Found {processed} MoMo transactions from {total_count} SMS messages")
         
-        # Parse transactions
-        print("⚙️ [WEB] Parsing uploaded XML...")
-        transactions, total_count = parser.parse_xml_file(filepath)
-        print(f"📊 [WEB] Found {len(transactions)} MoMo transactions from {total_count} SMS messages")
-        
-        if not transactions:
+        if not processed:
             print("⚠️ [WEB] No MoMo transactions found in uploaded file")
-            if upload_id:
-                DatabaseService.update_upload_record(upload_id, status='completed',
-                                                    total_messages=total_count,
-                                                    processed_messages=0)
             # Clean up uploaded file
             if os.path.exists(filepath):
                 os.remove(filepath)
             return jsonify({
                 'success': True,
-                'message': 'No MoMo transactions found in uploaded XML file',
+                'message': 'No new MoMo transactions since the last ingest' if mode in ('incremental', 'merge') else 'No MoMo transactions found in uploaded XML file',
                 'total_messages': total_count,
                 'processed': 0
             })
         
-        # CLEAR EXISTING DATA to prevent duplicates
-        print("🗑️ [WEB] Clearing existing transactions to prevent duplicates...")
-        DatabaseService.clear_transactions()
-        cleared_count = Transaction.query.count()
-        print(f"📊 [WEB] After clearing: {cleared_count} transactions")
-        
-        # Add new transactions
-        print("💾 [WEB] Adding uploaded transactions to database...")
-        processed = DatabaseService.add_multiple_transactions(transactions)
         print(f"✅ [WEB] Successfully added {processed} transactions from upload")
         
-        # Update upload history
-        if upload_id:
-            DatabaseService.update_upload_record(upload_id,
-                total_messages=total_count,
-                processed_messages=processed,
-                status='completed'
-            )
-        
         # Clean up uploaded file
         if os.path.exists(filepath):
             os.remove(filepath)
@@ -300,18 +454,15 @@ def upload_file():
         
     except ValueError as e:
         print(f"❌ [WEB] Upload ValueError: {e}")
-        if upload_id:
-            DatabaseService.update_upload_record(upload_id, status='failed')
         return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"❌ [WEB] Upload Exception: {e}")
         import traceback
         traceback.print_exc()
-        if upload_id:
-            DatabaseService.update_upload_record(upload_id, status='failed')
         return jsonify({'error': 'Internal server error while processing uploaded file'}), 500
 
 @main.route('/api/stats')
+@cached_response
 def get_stats():
     """Get overall statistics"""
     try:
@@ -324,6 +475,7 @@ def get_stats():
         return jsonify({'error': str(e)}), 500
 
 @main.route('/api/monthly-stats')
+@cached_response
 def get_monthly_stats():
     """Get monthly statistics"""
     try:
@@ -333,14 +485,34 @@ def get_monthly_stats():
         current_app.logger.error(f"Error getting monthly stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+@main.route('/api/daily-stats')
+@cached_response
+def get_daily_stats():
+    """Get daily statistics, optionally only the latest ``days`` days"""
+    try:
+        days = request.args.get('days', None, type=int)
+        daily_stats = DatabaseService.get_daily_stats(days)
+        return jsonify(daily_stats)
+    except Exception as e:
+        current_app.logger.error(f"Error getting daily stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @main.route('/api/transactions')
+@cached_response
 def get_transactions():
-    """Get paginated transactions"""
+    """Get paginated transactions
+
+    Pass ``cursor`` (empty for the first page, then the returned
+    ``next_cursor``) for keyset pagination; ``page`` keeps working as before.
+    With ``page``, ``sort=relevance`` ranks search results by full-text score.
+    """
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         category = request.args.get('category', None)
         search = request.args.get('search', None)
+        cursor = request.args.get('cursor', None)
+        sort = request.args.get('sort', 'date')
         
         # Validate pagination parameters
         if page < 1:
@@ -348,11 +520,26 @@ def get_transactions():
         if per_page < 1 or per_page > 100:
             per_page = 20
         
+        if cursor is not None:
+            try:
+                result = DatabaseService.get_transactions_page(
+                    cursor=cursor,
+                    per_page=per_page,
+                    category=category,
+                    search=search
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            print(f"📋 [API] Transactions request - returning {len(result['transactions'])} of {result['total']} total (cursor)")
+            return jsonify(result)
+        
         result = DatabaseService.get_all_transactions(
             page=page, 
             per_page=per_page, 
             category=category,
-            search=search
+            search=search,
+            sort=sort
         )
         
         print(f"📋 [API] Transactions request - returning {len(result['transactions'])} of {result['total']} total")
@@ -364,6 +551,7 @@ def get_transactions():
         return jsonify({'error': str(e)}), 500
 
 @main.route('/api/category-distribution')
+@cached_response
 def get_category_distribution():
     """Get distribution of transactions by category for pie chart"""
     try:
@@ -457,6 +645,15 @@ def get_upload_history():
         current_app.logger.error(f"Error getting upload history: {e}")
         return jsonify({'error': str(e)}), 500
 
+@main.route('/api/parser-stats')
+def get_parser_stats():
+    """Get per-pattern attempts, hits and time from the last profiled parse"""
+    return jsonify({
+        'enabled': current_app.config['PARSER_PROFILE'],
+        'stats': last_parser_stats or None,
+        'body_cache': get_body_cache().stats()
+    })
+
 @main.route('/health')
 def health_check():
     """Health check endpoint"""
@@ -467,7 +664,8 @@ def health_check():
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
             'transactions_count': stats.get('total_transactions', 0),
-            'database': 'SQLite'
+            'database': 'SQLite',
+            'response_cache': get_response_cache().stats()
         })
     except Exception as e:
         return jsonify({
@@ -0,0 +1,134 @@
+"""
+SQLite performance profiles for MoMo Analytics
+Named PRAGMA presets applied to every momo.db connection through SQLAlchemy
+pool events, with a temporary switch to the bulk-ingest preset for the
+connections an ingest writes through
+"""
+
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# PRAGMA presets; cache_size is negative KiB, mmap_size bytes, busy_timeout ms
+SQLITE_PROFILES = {
+    # SQLite defaults: rollback journal, fsync on every commit, readers blocked by writers
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000
+    },
+    # WAL lets the dashboard read during ingest; commits survive crashes, a power cut may lose the last one
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000
+    },
+    # No fsync and a large cache while loading; an OS crash or power cut mid-ingest can corrupt the database
+    'bulk-ingest': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -131072,
+        'mmap_size': 1024 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000
+    }
+}
+
+DEFAULT_SQLITE_PROFILE = 'balanced'
+BULK_INGEST_PROFILE = 'bulk-ingest'
+
+# The journal mode is stored in the database file and cannot change while other
+# connections are open, so it is only set on connect from the configured profile
+CONNECTION_PRAGMAS = ('synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout')
+
+# Profile state of each engine set up by install_sqlite_profile
+_engine_profiles = {}
+
+
+class _ProfileState:
+    """Configured profile of an engine and the threads currently running a bulk ingest on it"""
+    
+    def __init__(self, profile):
+        self.profile = profile
+        self.bulk = threading.local()
+    
+    @property
+    def active(self):
+        """Profile for connections checked out by the current thread"""
+        return BULK_INGEST_PROFILE if getattr(self.bulk, 'depth', 0) else self.profile
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run ``PRAGMA name=value`` for each setting on a raw sqlite3 connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def _connection_pragmas(profile):
+    return {name: SQLITE_PROFILES[profile][name] for name in CONNECTION_PRAGMAS}
+
+
+def install_sqlite_profile(engine, profile=DEFAULT_SQLITE_PROFILE):
+    """Apply a named profile to every connection the engine opens or hands out"""
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLite profile '{profile}', expected one of: {', '.join(SQLITE_PROFILES)}")
+    
+    state = _engine_profiles.get(engine)
+    if state is not None:
+        state.profile = profile
+        return
+    
+    state = _engine_profiles[engine] = _ProfileState(profile)
+    
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        active = state.active
+        apply_pragmas(dbapi_connection, {'journal_mode': SQLITE_PROFILES[state.profile]['journal_mode']})
+        apply_pragmas(dbapi_connection, _connection_pragmas(active))
+        connection_record.info['sqlite_profile'] = active
+    
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        # A pooled connection switches to bulk-ingest when an ingest writer checks it out
+        active = state.active
+        if connection_record.info.get('sqlite_profile') != active:
+            apply_pragmas(dbapi_connection, _connection_pragmas(active))
+            connection_record.info['sqlite_profile'] = active
+    
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        # Connections go back to the pool with the configured profile, so other
+        # requests never write with fsync off
+        if dbapi_connection is not None and connection_record.info.get('sqlite_profile') != state.profile:
+            apply_pragmas(dbapi_connection, _connection_pragmas(state.profile))
+            connection_record.info['sqlite_profile'] = state.profile
+
+
+@contextmanager
+def bulk_ingest_profile(engine):
+    """Use the bulk-ingest PRAGMAs for connections this thread checks out until the block exits
+
+    Only the calling thread is affected: connections used by other threads
+    (dashboard requests, the parser side of a pipeline) keep the configured
+    profile, and each connection is restored to it when returned to the pool.
+    """
+    state = _engine_profiles.get(engine)
+    if state is None:
+        yield
+        return
+    
+    state.bulk.depth = getattr(state.bulk, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        state.bulk.depth -= 1
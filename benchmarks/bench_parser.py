@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+SMSParser Micro-benchmarks for MoMo Analytics
+
+Measures messages/sec and peak RSS for parse_xml_file, categorize_transaction
+and each extract_* method on synthetic corpora. Every measurement runs in a
+fresh process so peak RSS is not polluted by earlier runs.
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.generate_corpus import generate_corpus
+
+DEFAULT_SIZES = [10000, 100000]
+DEFAULT_CORPUS_DIR = os.path.join(BENCH_DIR, 'corpus')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_THRESHOLD = 0.10
+
+# Per-body SMSParser methods benchmarked against the MoMo bodies of a corpus
+BODY_METHODS = [
+    'categorize_transaction',
+    'extract_amount',
+    'extract_fee',
+    'extract_balance',
+    'extract_transaction_id',
+    'extract_recipient_info',
+    'extract_sender_info',
+    'extract_message_content',
+    'extract_fields'
+]
+
+
+def _single_alternation_categorizer():
+    """The former categorize_transaction: one anchored alternation with a named group per category"""
+    import re
+    from app.parser import CATEGORIES
+    
+    alternatives = [r'(?P<%s>[\s\S]*?(?:%s))' % (category, '|'.join(patterns))
+                    for category, patterns in CATEGORIES.items()]
+    matcher = re.compile('(?:%s)' % '|'.join(alternatives), re.IGNORECASE)
+    
+    def categorize(body):
+        match = matcher.match(body)
+        return match.lastgroup if match else 'other'
+    return categorize
+
+
+# Replaced implementations, benchmarked on the same bodies to compare against the SMSParser methods
+REFERENCE_METHODS = {
+    'categorize_single_alternation': _single_alternation_categorizer
+}
+
+BENCHMARKS = ['parse_xml_file'] + BODY_METHODS + list(REFERENCE_METHODS)
+
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def _load_momo_bodies(parser, corpus_path):
+    bodies = []
+    elements = parser.iter_sms_elements(corpus_path)
+    next(elements)
+    for sms in elements:
+        if sms.get('address', '').lower() in parser.momo_addresses:
+            bodies.append(sms.get('body', ''))
+    return bodies
+
+
+def _run_benchmark(name, corpus_path, workers, result_queue):
+    """Run one benchmark in the current (fresh) process and report the result"""
+    import io
+    from contextlib import redirect_stdout
+    from app.parser import SMSParser
+    
+    parser = SMSParser()
+    try:
+        if name == 'parse_xml_file':
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                _, messages = parser.parse_xml_file(corpus_path, workers=workers)
+            seconds = time.perf_counter() - start
+        else:
+            bodies = _load_momo_bodies(parser, corpus_path)
+            method = REFERENCE_METHODS[name]() if name in REFERENCE_METHODS else getattr(parser, name)
+            start = time.perf_counter()
+            for body in bodies:
+                method(body)
+            seconds = time.perf_counter() - start
+            messages = len(bodies)
+    except Exception as e:
+        result_queue.put({'error': str(e)})
+        return
+    
+    result_queue.put({
+        'messages': messages,
+        'seconds': round(seconds, 4),
+        'messages_per_sec': round(messages / seconds, 1) if seconds else 0.0,
+        'peak_rss_mb': round(_peak_rss_mb(), 1)
+    })
+
+
+def run_benchmark(name, corpus_path, workers=1):
+    """Run a single benchmark in a spawned subprocess and return its metrics"""
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(target=_run_benchmark, args=(name, corpus_path, workers, result_queue))
+    process.start()
+    result = result_queue.get()
+    process.join()
+    
+    if 'error' in result:
+        raise RuntimeError(f"{name} failed: {result['error']}")
+    return result
+
+
+def ensure_corpus(size, corpus_dir=DEFAULT_CORPUS_DIR, noise_ratio=None):
+    """Return the corpus path for ``size`` messages, generating it if missing"""
+    suffix = '' if noise_ratio is None else f'_noise{noise_ratio:g}'
+    path = os.path.join(corpus_dir, f'momo_{size}{suffix}.xml')
+    if not os.path.exists(path):
+        print(f"📝 Generating corpus with {size} messages...")
+        generate_corpus(path, size, noise_ratio)
+    return path
+
+
+def run_suite(sizes, benchmarks=BENCHMARKS, corpus_dir=DEFAULT_CORPUS_DIR, noise_ratio=None, workers=1):
+    """Run every benchmark for every corpus size"""
+    results = {}
+    for size in sizes:
+        corpus_path = ensure_corpus(size, corpus_dir, noise_ratio)
+        print(f"\n📊 Corpus: {size} messages ({os.path.getsize(corpus_path) / (1024 * 1024):.1f} MB)")
+        results[str(size)] = {}
+        
+        for name in benchmarks:
+            result = run_benchmark(name, corpus_path, workers)
+            results[str(size)][name] = result
+            print(f"   {name:<30} {result['messages_per_sec']:>12,.0f} msg/s "
+                  f"{result['peak_rss_mb']:>8.1f} MB peak RSS")
+    
+    return {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'workers': workers,
+        'results': results
+    }
+
+
+def compare_results(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return a list of regressions beyond ``threshold`` relative to the baseline"""
+    regressions = []
+    for size, benchmarks in current['results'].items():
+        for name, result in benchmarks.items():
+            previous = baseline.get('results', {}).get(size, {}).get(name)
+            if not previous:
+                continue
+            
+            if result['messages_per_sec'] < previous['messages_per_sec'] * (1 - threshold):
+                regressions.append(
+                    f"{name} @ {size}: {result['messages_per_sec']:,.0f} msg/s "
+                    f"(baseline {previous['messages_per_sec']:,.0f})"
+                )
+            if result['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + threshold):
+                regressions.append(
+                    f"{name} @ {size}: {result['peak_rss_mb']:.1f} MB peak RSS "
+                    f"(baseline {previous['peak_rss_mb']:.1f} MB)"
+                )
+    
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Benchmark SMSParser throughput and memory")
+    parser.add_argument("--sizes", type=int, nargs='+', default=DEFAULT_SIZES,
+                       help="Corpus sizes in messages (default: 10000 100000)")
+    parser.add_argument("--only", nargs='+', choices=BENCHMARKS, default=BENCHMARKS,
+                       help="Run only the listed benchmarks")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR, help="Where generated corpora are kept")
+    parser.add_argument("--noise-ratio", type=float, default=None,
+                       help="Fraction of non-MoMo messages in generated corpora")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for parse_xml_file (default: 1)")
+    parser.add_argument("--save-baseline", nargs='?', const=DEFAULT_BASELINE,
+                       help="Write results as the new baseline (default: benchmarks/baseline.json)")
+    parser.add_argument("--compare", nargs='?', const=DEFAULT_BASELINE,
+                       help="Compare against a baseline and exit non-zero on regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                       help="Allowed slowdown / memory growth before flagging (default: 0.10)")
+    
+    args = parser.parse_args()
+    
+    current = run_suite(args.sizes, args.only, args.corpus_dir, args.noise_ratio, args.workers)
+    
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"\n💾 Baseline saved to {args.save_baseline}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {args.threshold:.0%}")
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Dashboard Query Benchmarks for MoMo Analytics
+
+Builds a synthetic transactions database (1M rows by default) from parsed
+corpus messages and times the DatabaseService queries behind the dashboard,
+first without the secondary transaction indexes and search index and then
+with them. The stats queries read the dashboard rollups, which are kept in
+both runs.
+"""
+
+import io
+import os
+import sqlite3
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+from flask import Flask
+from app import db
+from app.database import DatabaseService, SCHEMA_INDEXES, SEARCH_INDEX_SCHEMA
+from app.parser import SMSParser
+from app.records import TransactionRecord
+from app.sqlite_profiles import install_sqlite_profile
+from benchmarks.bench_parser import DEFAULT_CORPUS_DIR, ensure_corpus
+
+DEFAULT_ROWS = 1000000
+DEFAULT_REPEAT = 5
+# Distinct parsed messages the synthetic rows are drawn from
+SAMPLE_MESSAGES = 10000
+# Synthetic rows are spread evenly over this period, newest last
+DATE_SPAN = timedelta(days=3 * 365)
+
+TRANSACTION_INDEXES = [index for index in SCHEMA_INDEXES if index[1] == 'transactions']
+
+# Dashboard queries as (label, callable)
+QUERIES = [
+    ('transactions page 1', lambda: DatabaseService.get_all_transactions(page=1)),
+    ('transactions page 500', lambda: DatabaseService.get_all_transactions(page=500)),
+    ('category page 1', lambda: DatabaseService.get_all_transactions(page=1, category='payment_to_code')),
+    ('stats', DatabaseService.get_stats),
+    ('monthly stats', DatabaseService.get_monthly_stats),
+    ('category distribution', DatabaseService.get_category_distribution),
+    ('search common term', lambda: DatabaseService.get_all_transactions(page=1, search='Jane')),
+    ('search missing term', lambda: DatabaseService.get_all_transactions(page=1, search='Zebra')),
+    ('search relevance', lambda: DatabaseService.get_all_transactions(page=1, search='Jane', sort='relevance'))
+]
+
+
+def create_bench_app(db_path):
+    """Minimal app bound to the benchmark database instead of data/momo.db"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    
+    with app.app_context():
+        install_sqlite_profile(db.engine)
+        db.create_all()
+        # Databases built before the rollups existed
+        with db.engine.begin() as connection:
+            DatabaseService.sync_rollups(connection)
+    return app
+
+
+def build_database(app, rows, corpus_dir=DEFAULT_CORPUS_DIR):
+    """Fill the app's empty transactions table with ``rows`` synthetic rows"""
+    corpus_path = ensure_corpus(SAMPLE_MESSAGES, corpus_dir)
+    with redirect_stdout(io.StringIO()):
+        samples, _ = SMSParser().parse_xml_file(corpus_path)
+    
+    with app.app_context():
+        start_date = datetime.now() - DATE_SPAN
+        step = DATE_SPAN / rows
+        batch = []
+        for i in range(rows):
+            sample = samples[i % len(samples)]
+            record = TransactionRecord(sample.body, start_date + step * i, *sample.parsed_values())
+            if record.transaction_id:
+                # Keep rows unique under the transactions merge key
+                record.transaction_id = f'{record.transaction_id}-{i}'
+            batch.append(record)
+            if len(batch) == 50000:
+                DatabaseService.add_multiple_transactions(batch)
+                batch = []
+                print(f"   {i + 1:,} rows", end='\r')
+        if batch:
+            DatabaseService.add_multiple_transactions(batch)
+        db.session.remove()
+    print(f"   {rows:,} rows")
+
+
+def set_indexes(db_path, enabled):
+    """Create or drop the secondary transaction indexes and search index, returning the seconds taken"""
+    connection = sqlite3.connect(db_path)
+    try:
+        start = time.perf_counter()
+        for name, table, columns in TRANSACTION_INDEXES:
+            if enabled:
+                connection.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+            else:
+                connection.execute(f'DROP INDEX IF EXISTS {name}')
+        
+        if enabled:
+            for statement in SEARCH_INDEX_SCHEMA:
+                connection.execute(statement)
+            connection.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+        else:
+            connection.execute('DROP TRIGGER IF EXISTS transactions_fts_update')
+            connection.execute('DROP TABLE IF EXISTS transactions_fts')
+        connection.commit()
+        return time.perf_counter() - start
+    finally:
+        connection.close()
+
+
+def time_queries(app, repeat=DEFAULT_REPEAT):
+    """Best-of-``repeat`` milliseconds for every dashboard query"""
+    results = {}
+    with app.app_context():
+        for label, query in QUERIES:
+            timings = []
+            for _ in range(repeat):
+                # Time the count queries too, not the count cache
+                DatabaseService.bump_data_generation()
+                start = time.perf_counter()
+                query()
+                timings.append(time.perf_counter() - start)
+                db.session.remove()
+            results[label] = min(timings) * 1000
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Benchmark dashboard queries with and without secondary indexes")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="Transactions in the benchmark database (default: 1000000)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per query, the best is reported (default: 5)")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR, help="Where generated corpora and databases are kept")
+    
+    args = parser.parse_args()
+    
+    os.makedirs(args.corpus_dir, exist_ok=True)
+    db_path = os.path.join(args.corpus_dir, f'transactions_{args.rows}.db')
+    is_new = not os.path.exists(db_path)
+    app = create_bench_app(db_path)
+    set_indexes(db_path, False)
+    
+    if is_new:
+        print(f"📝 Building benchmark database with {args.rows:,} transactions...")
+        build_database(app, args.rows, args.corpus_dir)
+    
+    without = time_queries(app, args.repeat)
+    build_seconds = set_indexes(db_path, True)
+    with_indexes = time_queries(app, args.repeat)
+    
+    print(f"\n📊 {args.rows:,} transactions, best of {args.repeat} (index build {build_seconds:.1f}s)")
+    print(f"   {'query':<24} {'no index':>10} {'indexed':>10} {'speedup':>9}")
+    for label, _ in QUERIES:
+        speedup = without[label] / with_indexes[label] if with_indexes[label] else 0.0
+        print(f"   {label:<24} {without[label]:>8.1f}ms {with_indexes[label]:>8.1f}ms {speedup:>8.1f}x")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Synthetic SMS Backup Generator for MoMo Analytics
+
+Writes SMS Backup & Restore style <smses> files of any size for benchmarking.
+MoMo bodies are sampled from data/modified_sms_v2.xml so the template mix
+matches the real backup; transaction ids are re-randomised so bodies stay
+unique. Non-MoMo noise is mixed in at a configurable ratio.
+"""
+
+import os
+import random
+import re
+import sys
+import uuid
+from xml.sax.saxutils import escape
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FILE = os.path.join(PROJECT_ROOT, 'data', 'modified_sms_v2.xml')
+
+# Sender addresses used for the non-MoMo noise
+NOISE_ADDRESSES = ['+250788123456', '+250722654321', 'MTN', 'Airtel', 'BK', 'Equity', '+250795000111']
+
+NOISE_BODIES = [
+    "Hi, are we still meeting at 6pm today?",
+    "Your verification code is 482913. Do not share it with anyone.",
+    "Dear customer, your data bundle expires tomorrow. Dial *345# to renew.",
+    "Happy birthday! Wishing you a wonderful year ahead.",
+    "Call me when you get this message please",
+    "Your account 0001234 was credited with 15,000 RWF. Ref: SAL2024",
+    "Thank you for shopping with us. Your order #88213 has shipped.",
+    "Reminder: your appointment is scheduled for Monday at 10:00.",
+    "Ndagukunda cyane, tuzavugana ejo.",
+    "Network maintenance tonight from 01:00 to 03:00. We apologise for any inconvenience."
+]
+
+# Transaction ids that make otherwise identical bodies unique
+_TRANSACTION_ID = re.compile(r'(TxId: ?|Transaction Id: )(\d+)')
+
+
+def load_sample_bodies(sample_file=SAMPLE_FILE):
+    """Return the MoMo and non-MoMo bodies found in the sample backup"""
+    sys.path.insert(0, PROJECT_ROOT)
+    from app.parser import SMSParser
+    
+    parser = SMSParser(prefilter=False)
+    momo_bodies = []
+    other_bodies = []
+    elements = parser.iter_sms_elements(sample_file)
+    next(elements)
+    for sms in elements:
+        if sms.get('address', '').lower() in parser.momo_addresses:
+            momo_bodies.append(sms.get('body', ''))
+        else:
+            other_bodies.append(sms.get('body', ''))
+    
+    return momo_bodies, other_bodies
+
+
+def _randomise_ids(body, rng):
+    return _TRANSACTION_ID.sub(
+        lambda m: m.group(1) + ''.join(rng.choice('0123456789') for _ in m.group(2)),
+        body
+    )
+
+
+def _attr(value):
+    return '"%s"' % escape(str(value), {'"': '&quot;', '\n': '&#10;'})
+
+
+def generate_corpus(output_path, message_count, noise_ratio=None, seed=42, sample_file=SAMPLE_FILE):
+    """Write a synthetic backup with ``message_count`` <sms> elements
+
+    ``noise_ratio`` is the fraction of non-MoMo messages; by default it is
+    taken from the sample backup.
+    """
+    rng = random.Random(seed)
+    momo_bodies, other_bodies = load_sample_bodies(sample_file)
+    if not momo_bodies:
+        raise ValueError(f"No MoMo messages found in sample file: {sample_file}")
+    
+    if noise_ratio is None:
+        noise_ratio = len(other_bodies) / (len(momo_bodies) + len(other_bodies))
+    noise_bodies = other_bodies + NOISE_BODIES
+    
+    date_ms = 1704067200000  # 2024-01-01
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write("<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>\n")
+        f.write(f'<smses count="{message_count}" backup_set="{uuid.UUID(int=rng.getrandbits(128))}" '
+                f'backup_date="{date_ms}" type="full">\n')
+        
+        for _ in range(message_count):
+            date_ms += rng.randint(60, 3600) * 1000
+            if rng.random() < noise_ratio:
+                address = rng.choice(NOISE_ADDRESSES)
+                body = rng.choice(noise_bodies)
+            else:
+                address = 'M-Money'
+                body = _randomise_ids(rng.choice(momo_bodies), rng)
+            
+            f.write(f'  <sms protocol="0" address={_attr(address)} date="{date_ms}" type="1" subject="null" '
+                    f'body={_attr(body)} toa="null" sc_toa="null" service_center="+250788110381" read="1" '
+                    f'status="-1" locked="0" date_sent="{date_ms - 7000}" sub_id="6" '
+                    f'readable_date="" contact_name="(Unknown)" />\n')
+        
+        f.write('</smses>\n')
+    
+    return output_path
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Generate a synthetic SMS backup for benchmarking")
+    parser.add_argument("messages", type=int, help="Number of <sms> elements to write (e.g. 10000, 100000, 1000000)")
+    parser.add_argument("-o", "--output", help="Output path (default: benchmarks/corpus/momo_<messages>.xml)")
+    parser.add_argument("--noise-ratio", type=float, default=None,
+                       help="Fraction of non-MoMo messages (default: same as the sample backup)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    
+    args = parser.parse_args()
+    output = args.output or os.path.join(PROJECT_ROOT, 'benchmarks', 'corpus', f'momo_{args.messages}.xml')
+    
+    print(f"📝 Generating {args.messages} messages...")
+    generate_corpus(output, args.messages, args.noise_ratio, args.seed)
+    print(f"✅ Wrote {output} ({os.path.getsize(output)} bytes)")
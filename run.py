@@ -39,15 +39,19 @@ def format_file_size(size_bytes):
     return f"{size_bytes:.1f} {size_names[i]}"
 
 def scan_for_xml_files():
-    """Scan for XML files in data directory and current directory"""
+    """Scan for XML files (plain or compressed) in data directory and current directory"""
+    from app.parser import BACKUP_FILE_PATTERNS
+    
     print("🔍 Scanning for XML files...")
     
     # Look for XML files in data directory and current directory
-    xml_patterns = [
-        'data/*.xml',
-        'data/**/*.xml',
-        '*.xml',
-    ]
+    xml_patterns = []
+    for backup_pattern in BACKUP_FILE_PATTERNS:
+        xml_patterns.extend([
+            f'data/{backup_pattern}',
+            f'data/**/{backup_pattern}',
+            backup_pattern,
+        ])
     
     xml_files = []
     for pattern in xml_patterns:
@@ -77,13 +81,22 @@ def scan_for_xml_files():
     
     return file_info
 
+def print_database_stats(stats):
+    """Show what an auto-process loaded into the database"""
+    print(f"📊 Database populated:")
+    print(f"   • Transactions: {stats['total_transactions']}")
+    print(f"   • Total amount: {stats['total_amount']:,.0f} RWF")
+    print(f"   • Categories: {len(stats['categories'])}")
+
 def auto_process_xml():
     """Automatically process XML files if database is empty"""
     try:
         from app import create_app
         from app.models import Transaction
-        from app.database import DatabaseService
-        from app.parser import SMSParser
+        from app.database import DatabaseService, DEFAULT_SOURCE
+        from app.parser import SMSParser, XMLValidationError, PATTERN_FINGERPRINT
+        from app.cache import ParseCache, BodyCache, DEFAULT_BODY_CACHE_PATH
+        from app.pipeline import run_ingest_pipeline, ingest_files
         
         # Create Flask app context
         app = create_app()
@@ -117,53 +130,75 @@ def auto_process_xml():
             for i, file_info in enumerate(xml_files[:3]):  # Show first 3
                 print(f"   {i+1}. {file_info['name']} ({file_info['size_str']})")
             
-            # Process the first (newest) file
+            # Several backups (e.g. from different phones): ingest them all as one de-duplicated batch
+            if len(xml_files) > 1:
+                print(f"\n🚀 Auto-processing all {len(xml_files)} files as one batch")
+                try:
+                    result = ingest_files([file_info['path'] for file_info in xml_files])
+                except Exception as e:
+                    print(f"❌ Processing error: {e}")
+                    return False
+                
+                for file_info in result['files']:
+                    print(f"   • {file_info['filename']}: {file_info['processed_messages']} new, "
+                          f"{file_info['duplicate_messages']} duplicates ({file_info['status']})")
+                
+                if not result['processed']:
+                    print("⚠️  No MoMo transactions found")
+                    print("💡 Ensure XML contains Mobile Money SMS messages")
+                    return False
+                
+                print(f"✅ Successfully processed {result['processed']} transactions!")
+                print_database_stats(DatabaseService.get_stats())
+                return True
+            
+            # Process the only file
             selected_file = xml_files[0]
             print(f"\n🚀 Auto-processing: {selected_file['name']}")
             
             try:
-                # Parse the XML file
-                parser = SMSParser()
+                # Parse the XML file, reusing fields of bodies parsed before
+                body_cache = BodyCache(
+                    max_entries=app.config['BODY_CACHE_ENTRIES'],
+                    db_path=DEFAULT_BODY_CACHE_PATH if app.config['BODY_CACHE_PERSIST'] else None,
+                    version=PATTERN_FINGERPRINT
+                )
+                parser = SMSParser(body_cache=body_cache)
                 
-                # Validate XML structure
-                is_valid, validation_message = parser.validate_xml_structure(selected_file['path'])
-                if not is_valid:
-                    print(f"❌ Invalid XML: {validation_message}")
+                # Parse and save to database concurrently, validating the XML structure as it streams
+                print("⚙️  Parsing SMS messages and saving to database...")
+                parse_cache = ParseCache(max_bytes=app.config['PARSE_CACHE_MAX_BYTES'])
+                content_hash = parse_cache.hash_file(selected_file['path'])
+                try:
+                    processed = run_ingest_pipeline(
+                        parser.iter_transactions_cached(selected_file['path'], parse_cache, content_hash)
+                    )
+                except XMLValidationError as e:
+                    print(f"❌ Invalid XML: {e}")
                     return False
                 
+                total_count = parser.sms_count
                 print("✅ XML validation passed")
                 
-                # Parse transactions
-                print("⚙️  Parsing SMS messages...")
-                transactions, total_count = parser.parse_xml_file(selected_file['path'])
-                
-                if not transactions:
+                if not processed:
                     print("⚠️  No MoMo transactions found")
                     print("💡 Ensure XML contains Mobile Money SMS messages")
                     return False
                 
-                print(f"📊 Found {len(transactions)} MoMo transactions out of {total_count} SMS messages")
-                
-                # Save to database
-                print("💾 Saving to database...")
-                processed = DatabaseService.add_multiple_transactions(transactions)
+                print(f"📊 Found {processed} MoMo transactions out of {total_count} SMS messages")
+                DatabaseService.set_watermark(DEFAULT_SOURCE, parser.max_sms_date)
                 
                 # Create upload record
                 DatabaseService.add_upload_record(
                     filename=selected_file['name'],
                     total_messages=total_count,
                     processed_messages=processed,
-                    status='completed'
+                    status='completed',
+                    content_hash=content_hash
                 )
                 
                 print(f"✅ Successfully processed {processed} transactions!")
-                
-                # Show stats
-                stats = DatabaseService.get_stats()
-                print(f"📊 Database populated:")
-                print(f"   • Transactions: {stats['total_transactions']}")
-                print(f"   • Total amount: {stats['total_amount']:,.0f} RWF")
-                print(f"   • Categories: {len(stats['categories'])}")
+                print_database_stats(DatabaseService.get_stats())
                 
                 return True
                 
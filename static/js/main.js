@@ -193,9 +193,10 @@ document.addEventListener('DOMContentLoaded', () => {
     function handleFiles(files) {
         const file = files[0];
         
-        // Validate file type
-        if (!file.name.toLowerCase().endsWith('.xml')) {
-            showError('Please select an XML file');
+        // Validate file type (plain or compressed XML backup)
+        const name = file.name.toLowerCase();
+        if (!['.xml', '.gz', '.bz2', '.zip'].some(extension => name.endsWith(extension))) {
+            showError('Please select an XML file (.xml, .gz, .bz2 or .zip)');
             return;
         }
         
@@ -0,0 +1,301 @@
+"""
+Behaviour tests for the database side of ingestion
+Each test case runs on its own scratch SQLite file created through create_app,
+starting every test from an empty transactions table
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from app import create_app, db
+from app.database import DatabaseService, ROLLUP_TABLES, SEARCH_COLUMNS
+from app.models import Transaction
+from app.pipeline import run_ingest_pipeline
+from app.records import TransactionRecord
+
+
+def make_transaction(index, category='incoming_money'):
+    """A distinct parsed transaction, one hour after the previous index"""
+    return TransactionRecord(
+        f'You have received {1000 + index} RWF from Sender {index}. TxId: {index}',
+        datetime(2024, 5, 1) + timedelta(hours=index),
+        category,
+        amount=1000.0 + index,
+        fee=10.0,
+        transaction_id=f'TX{index:06d}',
+        sender_name=f'Sender {index}'
+    )
+
+
+def failing_after(transactions, count):
+    """Yield the first ``count`` transactions, then fail like a parse error part-way through a backup"""
+    for index, transaction in enumerate(transactions):
+        if index == count:
+            raise ValueError("Invalid XML file format: premature end of data")
+        yield transaction
+
+
+class DatabaseTestCase(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.app = create_app(db_path=os.path.join(cls.directory, 'momo.db'))
+        cls.context = cls.app.app_context()
+        cls.context.push()
+    
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.engine.dispose()
+        cls.context.pop()
+        shutil.rmtree(cls.directory)
+    
+    def setUp(self):
+        DatabaseService.clear_transactions()
+        # The ingest path reports its progress on stdout
+        output = contextlib.redirect_stdout(io.StringIO())
+        output.__enter__()
+        self.addCleanup(output.__exit__, None, None, None)
+    
+    def stored_ids(self):
+        return sorted(row.transaction_id for row in Transaction.query.all())
+
+
+class ResumeTest(DatabaseTestCase):
+    """A chunked ingest that fails keeps its committed chunks, and a rerun resumes after them"""
+    
+    def test_failed_ingest_resumes_after_the_last_commit(self):
+        transactions = [make_transaction(index) for index in range(50)]
+        upload_id = DatabaseService.add_upload_record('backup.xml', status='processing', content_hash='abc')
+        
+        with self.assertRaises(ValueError):
+            run_ingest_pipeline(failing_after(transactions, 35), replace=True, batch_size=10, commit_every=20,
+                                upload_id=upload_id)
+        DatabaseService.update_upload_record(upload_id, status='failed')
+        
+        # Only the first chunk of 20 was committed, and the record counts exactly those
+        db.session.remove()
+        self.assertEqual(Transaction.query.count(), 20)
+        resumable = DatabaseService.find_resumable_upload('abc')
+        self.assertEqual(resumable['id'], upload_id)
+        self.assertEqual(resumable['processed_messages'], 20)
+        
+        skip = resumable['processed_messages']
+        processed = skip + run_ingest_pipeline(iter(transactions), batch_size=10, commit_every=20,
+                                               upload_id=upload_id, skip=skip)
+        self.assertEqual(processed, 50)
+        self.assertEqual(self.stored_ids(), sorted(transaction.transaction_id for transaction in transactions))
+    
+    def test_completed_ingest_is_not_resumed(self):
+        upload_id = DatabaseService.add_upload_record('backup.xml', status='processing', content_hash='abc')
+        run_ingest_pipeline(iter([make_transaction(index) for index in range(5)]), replace=True, upload_id=upload_id)
+        DatabaseService.update_upload_record(upload_id, status='completed', processed_messages=5)
+        self.assertIsNone(DatabaseService.find_resumable_upload('abc'))
+    
+    def test_replace_without_transactions_keeps_the_data(self):
+        DatabaseService.add_multiple_transactions([make_transaction(index) for index in range(3)])
+        self.assertEqual(run_ingest_pipeline(iter([]), replace=True), 0)
+        self.assertEqual(Transaction.query.count(), 3)
+
+
+class MergeTest(DatabaseTestCase):
+    """A merge inserts only transactions whose merge key is not stored yet"""
+    
+    def test_merge_adds_only_new_transactions(self):
+        DatabaseService.add_multiple_transactions([make_transaction(index) for index in range(10)])
+        
+        processed = run_ingest_pipeline(iter([make_transaction(index) for index in range(5, 15)]), merge=True)
+        self.assertEqual(processed, 5)
+        self.assertEqual(self.stored_ids(), [f'TX{index:06d}' for index in range(15)])
+    
+    def test_merge_matches_transactions_without_id_on_date_amount_and_body(self):
+        first = make_transaction(1)
+        first.transaction_id = None
+        moved = make_transaction(1)
+        moved.transaction_id = None
+        moved.date += timedelta(minutes=1)
+        DatabaseService.add_multiple_transactions([first])
+        
+        self.assertEqual(DatabaseService.add_multiple_transactions([first, moved], merge=True), 1)
+        self.assertEqual(Transaction.query.count(), 2)
+    
+    def test_plain_insert_keeps_repeats(self):
+        # Outside a merge a repeated transaction is still stored, just without a merge key
+        DatabaseService.add_multiple_transactions([make_transaction(1), make_transaction(1)])
+        self.assertEqual(self.stored_ids(), ['TX000001', 'TX000001'])
+        self.assertEqual(DatabaseService.add_multiple_transactions([make_transaction(1)], merge=True), 0)
+
+
+class CursorPagingTest(DatabaseTestCase):
+    """Cursor pages walk every transaction once, newest first, ties on date broken by id"""
+    
+    def setUp(self):
+        super().setUp()
+        transactions = [make_transaction(index, 'incoming_money' if index % 3 else 'payment_to_code')
+                        for index in range(23)]
+        # Transactions sharing a date must still be paged in a stable order without gaps or repeats
+        for transaction in transactions[10:16]:
+            transaction.date = datetime(2024, 5, 1, 10)
+        DatabaseService.add_multiple_transactions(transactions)
+    
+    def walk(self, **filters):
+        pages = []
+        cursor = None
+        while True:
+            page = DatabaseService.get_transactions_page(cursor=cursor, per_page=4, **filters)
+            pages.append(page)
+            cursor = page['next_cursor']
+            if cursor is None:
+                return pages
+    
+    def expected_order(self, query):
+        return [row.id for row in query.order_by(Transaction.date.desc(), Transaction.id.desc())]
+    
+    def test_pages_cover_every_transaction_in_order(self):
+        pages = self.walk()
+        ids = [transaction['id'] for page in pages for transaction in page['transactions']]
+        self.assertEqual(ids, self.expected_order(Transaction.query))
+        self.assertEqual(len(pages), 6)
+        self.assertTrue(all(page['total'] == 23 for page in pages))
+    
+    def test_pages_of_a_category(self):
+        pages = self.walk(category='payment_to_code')
+        ids = [transaction['id'] for page in pages for transaction in page['transactions']]
+        self.assertEqual(ids, self.expected_order(Transaction.query.filter_by(category='payment_to_code')))
+        self.assertEqual(pages[0]['total'], 8)
+    
+    def test_malformed_cursor_raises(self):
+        with self.assertRaises(ValueError):
+            DatabaseService.get_transactions_page(cursor='not-a-cursor')
+
+
+class SearchIndexTest(DatabaseTestCase):
+    """The full-text index follows inserts, updates and clears, finding what a LIKE scan finds"""
+    
+    def setUp(self):
+        if not DatabaseService.has_search_index():
+            self.skipTest("SQLite without FTS5 trigram support")
+        super().setUp()
+    
+    def search_ids(self, term):
+        return sorted(row.id for row in DatabaseService.filtered_transactions(search=term))
+    
+    def like_ids(self, term):
+        condition = ' OR '.join(f'{column} LIKE :term' for column in SEARCH_COLUMNS)
+        rows = db.session.execute(text(f'SELECT id FROM transactions WHERE {condition}'), {'term': f'%{term}%'})
+        return sorted(row_id for (row_id,) in rows)
+    
+    def test_every_insert_batch_is_indexed(self):
+        run_ingest_pipeline(iter([make_transaction(index) for index in range(45)]), batch_size=10)
+        for term in ('Sender 1', 'sender 42', 'TX00002', 'payment', 'incoming_money'):
+            self.assertEqual(self.search_ids(term), self.like_ids(term), term)
+        self.assertEqual(len(self.search_ids('Sender 1')), 11)
+    
+    def test_cleared_rows_leave_the_index(self):
+        DatabaseService.add_multiple_transactions([make_transaction(index) for index in range(5)])
+        DatabaseService.clear_transactions()
+        DatabaseService.add_multiple_transactions([make_transaction(7)])
+        self.assertEqual(len(self.search_ids('Sender')), 1)
+        db.session.execute(text("INSERT INTO transactions_fts (transactions_fts) VALUES ('integrity-check')"))
+    
+    def test_updated_rows_are_reindexed(self):
+        DatabaseService.add_multiple_transactions([make_transaction(index) for index in range(5)])
+        transaction = Transaction.query.filter_by(transaction_id='TX000003').one()
+        transaction.sender_name = 'Renamed Person'
+        db.session.commit()
+        DatabaseService.bump_data_generation()
+        
+        self.assertEqual(self.search_ids('Renamed'), [transaction.id])
+        self.assertEqual(self.search_ids('Sender 3'), [])
+    
+    def test_reset_leaves_no_stale_rows(self):
+        DatabaseService.add_multiple_transactions([make_transaction(index) for index in range(5)])
+        # The steps of init_database's reset
+        DatabaseService.drop_search_index()
+        db.drop_all()
+        db.create_all()
+        DatabaseService.upgrade_schema()
+        
+        DatabaseService.add_multiple_transactions([make_transaction(8)])
+        self.assertEqual(len(self.search_ids('Sender')), 1)
+        db.session.execute(text("INSERT INTO transactions_fts (transactions_fts) VALUES ('integrity-check')"))
+
+
+class RollupTest(DatabaseTestCase):
+    """The dashboard rollups always add up to the stored transactions"""
+    
+    def spread_transactions(self, indexes):
+        """Transactions two days apart in alternating categories, so they span months and days"""
+        transactions = []
+        for index in indexes:
+            transaction = make_transaction(index, 'incoming_money' if index % 2 else 'payment_to_code')
+            transaction.date = datetime(2024, 5, 1, 9) + timedelta(days=2 * index)
+            transactions.append(transaction)
+        return transactions
+    
+    def assertRollupsMatch(self):
+        for name, keys, expressions in ROLLUP_TABLES:
+            order = ', '.join(str(position) for position in range(1, len(keys) + 1))
+            rolled_up = db.session.execute(text(
+                f"SELECT {', '.join(keys)}, count, amount, fees FROM {name} ORDER BY {order}")).all()
+            aggregated = db.session.execute(text(
+                f"SELECT {', '.join(expressions)}, count(*), sum(amount), coalesce(sum(fee), 0) FROM transactions "
+                f"GROUP BY {', '.join(expressions)} ORDER BY {order}")).all()
+            self.assertEqual(rolled_up, aggregated, name)
+    
+    def test_inserts_across_batches(self):
+        run_ingest_pipeline(iter(self.spread_transactions(range(40))), batch_size=7)
+        self.assertRollupsMatch()
+        
+        stats = DatabaseService.get_stats()
+        self.assertEqual(stats['total_transactions'], 40)
+        self.assertEqual(stats['total_amount'], sum(1000.0 + index for index in range(40)))
+        self.assertEqual(stats['total_fees'], 400.0)
+        self.assertEqual(sum(month['count'] for month in DatabaseService.get_monthly_stats()), 40)
+        self.assertEqual(sum(day['count'] for day in DatabaseService.get_daily_stats()), 40)
+        self.assertEqual({entry['category']: entry['count'] for entry in DatabaseService.get_category_distribution()},
+                         {'Incoming Money': 20, 'Payment To Code': 20})
+    
+    def test_merge_counts_only_new_transactions(self):
+        DatabaseService.add_multiple_transactions(self.spread_transactions(range(20)))
+        run_ingest_pipeline(iter(self.spread_transactions(range(10, 30))), merge=True, batch_size=6)
+        self.assertEqual(DatabaseService.get_stats()['total_transactions'], 30)
+        self.assertRollupsMatch()
+    
+    def test_resumed_ingest(self):
+        transactions = self.spread_transactions(range(50))
+        with self.assertRaises(ValueError):
+            run_ingest_pipeline(failing_after(transactions, 35), replace=True, batch_size=10, commit_every=20)
+        db.session.remove()
+        self.assertRollupsMatch()
+        
+        run_ingest_pipeline(iter(transactions), batch_size=10, skip=20)
+        self.assertEqual(DatabaseService.get_stats()['total_transactions'], 50)
+        self.assertRollupsMatch()
+    
+    def test_clear_empties_the_rollups(self):
+        DatabaseService.add_multiple_transactions(self.spread_transactions(range(10)))
+        DatabaseService.clear_transactions()
+        self.assertRollupsMatch()
+        self.assertEqual(DatabaseService.get_stats()['total_transactions'], 0)
+        self.assertEqual(DatabaseService.get_daily_stats(), [])
+    
+    def test_sync_rebuilds_after_direct_writes(self):
+        DatabaseService.add_multiple_transactions(self.spread_transactions(range(10)))
+        with db.engine.begin() as connection:
+            connection.execute(text("INSERT INTO transactions (date, amount, fee, category) "
+                                    "VALUES ('2024-08-01 09:00:00.000000', 500, 5, 'airtime')"))
+            self.assertTrue(DatabaseService.sync_rollups(connection))
+            self.assertFalse(DatabaseService.sync_rollups(connection))
+        self.assertRollupsMatch()
+
+
+if __name__ == '__main__':
+    unittest.main()
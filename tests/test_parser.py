@@ -0,0 +1,205 @@
+"""
+Equivalence tests for the fused SMS field extractor and message templates
+extract_fields(), extract_transaction() and categorize_transaction() must give
+the same results as the original per-pattern searches they replace, and the
+known message formats must keep taking their templates
+"""
+
+import contextlib
+import io
+import os
+import re
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+from lxml import etree
+from app.parser import SMSParser, MOMO_ADDRESSES, CATEGORIES
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'modified_sms_v2.xml')
+
+
+def load_momo_bodies(file_path=SAMPLE_FILE):
+    """Bodies of every MoMo message in an SMS backup, in file order"""
+    tree = etree.parse(file_path)
+    return [
+        sms.get('body', '')
+        for sms in tree.getroot().iter('sms')
+        if sms.get('address', '').lower() in MOMO_ADDRESSES
+    ]
+
+
+def expected_category(body):
+    """Category as chosen by the original loop, one search per pattern in priority order"""
+    for category, patterns in CATEGORIES.items():
+        for pattern in patterns:
+            if re.search(pattern, body, re.IGNORECASE):
+                return category
+    return 'other'
+
+
+def expected_fields(parser, body):
+    """Fields as computed by the individual extract_* methods"""
+    recipient_name, recipient_number = parser.extract_recipient_info(body)
+    sender_name, sender_number = parser.extract_sender_info(body)
+    return {
+        'amount': parser.extract_amount(body),
+        'fee': parser.extract_fee(body),
+        'balance': parser.extract_balance(body),
+        'transaction_id': parser.extract_transaction_id(body),
+        'recipient_name': recipient_name,
+        'recipient_number': recipient_number,
+        'sender_name': sender_name,
+        'sender_number': sender_number,
+        'message': parser.extract_message_content(body)
+    }
+
+
+class FusedExtractorTest(unittest.TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.bodies = load_momo_bodies()
+    
+    def setUp(self):
+        self.parser = SMSParser()
+    
+    def test_sample_file_has_momo_messages(self):
+        self.assertGreater(len(self.bodies), 1000)
+    
+    def test_extract_fields_matches_extract_methods(self):
+        for body in self.bodies:
+            expected = expected_fields(self.parser, body)
+            fields = self.parser.extract_fields(body)
+            self.assertEqual(set(fields), set(expected), body)
+            for field, value in expected.items():
+                self.assertEqual(fields[field], value, f'{field}: {body}')
+    
+    def test_categorize_transaction_matches_pattern_loop(self):
+        bodies = self.bodies + [
+            'Bank deposit of 5000 RWF has been added; you have received it from the bank',
+            'Your payment of 200 RWF to Airtime has been completed',
+            'Check your balance by dialling *182#',
+            'Hello, see you tomorrow'
+        ]
+        # Upper-cased copies check that keyword gating stays case-insensitive
+        for body in bodies + [body.upper() for body in bodies]:
+            self.assertEqual(self.parser.categorize_transaction(body), expected_category(body), body)
+    
+    def test_extract_transaction_matches_extract_methods(self):
+        date = datetime(2024, 5, 10, 16, 30, 51)
+        for body in self.bodies:
+            transaction = self.parser.extract_transaction(body, date)
+            expected = expected_fields(self.parser, body)
+            expected['category'] = expected_category(body)
+            
+            self.assertEqual(transaction.body, body)
+            self.assertEqual(transaction.raw_body, body)
+            self.assertEqual(transaction.date, date)
+            for field, value in expected.items():
+                self.assertEqual(transaction[field], value, f'{field}: {body}')
+
+
+
+class TemplateHitTest(unittest.TestCase):
+    
+    def test_sample_file_template_hits(self):
+        # Every well-formed message of the known formats must take its template, so a guard that
+        # rejects ordinary names or trailing text shows up as a drop here
+        parser = SMSParser()
+        date = datetime(2024, 5, 10, 16, 30, 51)
+        for body in load_momo_bodies():
+            parser.extract_transaction(body, date)
+        
+        self.assertEqual(parser.template_stats(), {
+            'incoming_money': 56,
+            'payment_to_code': 658,
+            'transfer_to_number': 585,
+            'bank_deposit': 248,
+            'fallback': 144
+        })
+    
+    def test_names_containing_pattern_words_take_the_template(self):
+        parser = SMSParser()
+        for name in ('Aziza Uwase', 'Tony Smith', 'David Cash'):
+            body = (f'TxId: 73214484437. Your payment of 1,000 RWF to {name} 12845 has been completed at '
+                    f'2024-05-10 16:31:39. Your new balance: 1,000 RWF. Fee was 0 RWF.')
+            self.assertIsNotNone(parser.match_template(body), name)
+            self.assertEqual(parser.match_template(body)[1]['recipient_name'], name)
+
+
+
+MOMO_BODY = ('You have received 2000 RWF from Jane Smith (*********013) on your mobile money account at '
+             '2024-05-10 16:30:51. Message from sender: {}. Your new balance:2000 RWF. '
+             'Financial Transaction Id: 76662021700.')
+
+
+def sms_record(address, body, date=1715351451000, quote='"'):
+    return f'<sms address={quote}{address}{quote} date="{date}" body="{body}" />'
+
+
+class PrefilterTest(unittest.TestCase):
+    """The byte-level pre-filter must parse every backup exactly like iterparse, or fail like it"""
+    
+    def write_backup(self, content):
+        handle, path = tempfile.mkstemp(suffix='.xml')
+        with os.fdopen(handle, 'wb') as f:
+            f.write(content if isinstance(content, bytes) else content.encode('utf-8'))
+        self.addCleanup(os.remove, path)
+        return path
+    
+    def parse(self, path, prefilter):
+        parser = SMSParser(prefilter=prefilter)
+        with contextlib.redirect_stdout(io.StringIO()):
+            transactions, sms_count = parser.parse_xml_file(path, workers=1)
+        return [dict(transaction) for transaction in transactions], sms_count
+    
+    def assertSameParse(self, path):
+        expected = self.parse(path, prefilter=False)
+        self.assertEqual(self.parse(path, prefilter=True), expected)
+        return expected
+    
+    def assertBothFail(self, path):
+        for prefilter in (False, True):
+            with self.assertRaises(ValueError, msg=f'prefilter={prefilter}'):
+                self.parse(path, prefilter)
+    
+    def test_sample_file_in_small_chunks(self):
+        expected = self.parse(SAMPLE_FILE, prefilter=False)
+        for chunk_size in (7, 64, 4096):
+            with mock.patch('app.parser.PREFILTER_CHUNK_SIZE', chunk_size):
+                self.assertEqual(self.parse(SAMPLE_FILE, prefilter=True), expected, chunk_size)
+    
+    def test_backup_cut_off_between_records(self):
+        with open(SAMPLE_FILE, 'rb') as f:
+            content = f.read()
+        cut = content.rindex(b'/>', 0, len(content) // 2) + 2
+        self.assertBothFail(self.write_backup(content[:cut]))
+    
+    def test_content_after_the_root(self):
+        records = sms_record('M-Money', MOMO_BODY.format('hi'))
+        self.assertBothFail(self.write_backup(f'<smses count="2">{records}</smses>{records}'))
+    
+    def test_non_utf8_declared_encoding(self):
+        records = sms_record('M-Money', MOMO_BODY.format('Caf\u00e9')) + sms_record('Friend', 'Bonne journ\u00e9e')
+        content = f'<?xml version="1.0" encoding="ISO-8859-1"?>\n<smses count="2">{records}</smses>'
+        transactions, sms_count = self.assertSameParse(self.write_backup(content.encode('iso-8859-1')))
+        self.assertEqual(len(transactions), 1)
+        self.assertIn('Caf\u00e9', transactions[0]['body'])
+    
+    def test_comment_before_the_root(self):
+        records = sms_record('M-Money', MOMO_BODY.format('hi')) + sms_record('Friend', 'hello')
+        content = (f'<?xml version="1.0" encoding="UTF-8"?>\n<!-- <sms address="M-Money" count="9"> -->\n'
+                   f'<smses count="2">{records}</smses>')
+        transactions, sms_count = self.assertSameParse(self.write_backup(content))
+        self.assertEqual((len(transactions), sms_count), (1, 2))
+    
+    def test_encoded_and_single_quoted_addresses(self):
+        records = (sms_record('Friend', 'hello') + sms_record('M&#45;Money', MOMO_BODY.format('a'))
+                   + sms_record('momo', MOMO_BODY.format('b'), quote="'") + sms_record('MoMo Friend', 'hi'))
+        transactions, sms_count = self.assertSameParse(self.write_backup(f'<smses count="4">{records}</smses>'))
+        self.assertEqual(len(transactions), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()